@@ -4,25 +4,298 @@ Uses LangChain and Google Gemini to handle natural language conversations.
 """
 
 import os
+import json
+import asyncio
+import time
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 from dotenv import load_dotenv
+from calendar_service import CalendarService
+import ciso8601
+
 try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    from langchain.schema import HumanMessage, AIMessage, SystemMessage
-    from langchain.memory import ConversationBufferMemory
+    # RE2 matches in linear time and keeps adversarial input from backtracking
+    import re2 as re
 except ImportError:
-    raise ImportError(
-        "langchain-google-genai package not found. "
-        "Install it with: pip install langchain-google-genai"
-    )
-from calendar_service import CalendarService
-import re
-import pytz
+    import re
 
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+# LangChain classes, imported by `_load_langchain` when the first agent is
+# created; langchain_google_genai pulls in grpc/protobuf and is slow to import,
+# and the extractors don't need it
+ChatGoogleGenerativeAI = None
+HumanMessage = AIMessage = SystemMessage = None
+
+
+def _load_langchain():
+    """Import the LangChain and Gemini classes on first use."""
+    global ChatGoogleGenerativeAI, HumanMessage, AIMessage, SystemMessage
+    if ChatGoogleGenerativeAI is not None:
+        return
+    try:
+        from langchain_google_genai import ChatGoogleGenerativeAI as chat_model
+        from langchain.schema import HumanMessage, AIMessage, SystemMessage
+    except ImportError:
+        raise ImportError(
+            "langchain-google-genai package not found. "
+            "Install it with: pip install langchain-google-genai"
+        )
+    ChatGoogleGenerativeAI = chat_model
+
+
+# Patterns used by the extractors, compiled once at import time.
+# Flags are inline so the same patterns work with both re2 and re.
+_NAME_PATS = (
+    re.compile(r"(?i)(?:my name is|i'm|i am|call me)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)"),
+    re.compile(r"(?i)^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)$"),
+)
+_BARE_NAME_RE = re.compile(r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*$')
+
+# One alternation for every date keyword; the first three letters of the
+# matched token ('tod', 'tom', 'mon', ...) identify it
+_DATE_RE = re.compile(
+    r'\b(today|tomorrow|mon(?:day)?|tue(?:s(?:day)?)?|wed(?:s|nesday)?'
+    r'|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?)\b'
+)
+_WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+_ONE_DAY = timedelta(days=1)
+
+@functools.lru_cache(maxsize=8)
+def _get_date_parser(tz_name: str):
+    """
+    Build a dateparser parser for `tz_name` on first use.
+    
+    dateparser is slow to import, so it is only loaded when a message isn't
+    understood by the patterns above.
+    """
+    try:
+        from dateparser.date import DateDataParser
+    except ImportError:
+        return None
+    return DateDataParser(languages=['en'], settings={
+        'PREFER_DATES_FROM': 'future',
+        'TIMEZONE': tz_name,
+        'RETURN_AS_TIMEZONE_AWARE': True,
+        'RETURN_TIME_AS_PERIOD': True,
+    })
+
+# dateparser results are only trusted when the message names a date
+# ("Oct 20", "the 15th", "1/15", "in 3 days") or a relative time
+# ("in 2 hours"); bare numbers like "10" otherwise come back as months
+_MONTH = (r'(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?'
+          r'|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)')
+_DATE_TOKEN_RE = re.compile(
+    r'\b(?:' + _MONTH + r'\.?\s+\d{1,2}(?:st|nd|rd|th)?'
+    r'|\d{1,2}(?:st|nd|rd|th)?\s+(?:of\s+)?' + _MONTH +
+    r'|\d{1,2}(?:st|nd|rd|th)'
+    r'|\d{1,2}/\d{1,2}(?:/\d{2,4})?'
+    r'|\d+\s+days?)\b'
+)
+_RELATIVE_TIME_RE = re.compile(r'\bin\s+(?:\d+|an?)\s+(?:hours?|hrs?|minutes?|mins?)\b')
+
+# "at 2" with no minutes or am/pm, which dateparser reads as February
+_BARE_HOUR_RE = re.compile(r'\bat\s+(\d{1,2})\b(\s*(?:[:.]\d{2}|[ap]\.?m))?')
+
+# How far ahead a parsed date may be; matches CalendarService's lookahead
+_MAX_DAYS_AHEAD = 30
+
+def _expand_bare_hour(match) -> str:
+    """
+    `_BARE_HOUR_RE` replacement: "at 2" -> "at 14:00".
+    
+    Hours 1-7 are read as afternoon, as nobody books a 2 AM visit.
+    """
+    if match.group(2):
+        return match.group(0)
+    hour = int(match.group(1))
+    if 1 <= hour <= 7:
+        hour += 12
+    return f"at {hour}:00"
+
+# Whole-word confirmations, so e.g. "yesterday" or "token" don't book.
+# Matched against the lowercased message.
+_CONFIRM_RE = re.compile(
+    r'\b(?:yes|yeah|yep|confirm|book it|schedule|that works|ok|okay|sure|proceed|go ahead)\b'
+)
+
+# 12-hour with minutes ("10:30am" or "10.30am"), bare 12-hour, then 24-hour
+_TIME_RE = re.compile(
+    r'(?P<h12>\d{1,2})[:.](?P<m12>\d{2})\s*(?P<ap>am|pm)'
+    r'|(?P<h>\d{1,2})\s*(?P<ap2>am|pm)'
+    r'|(?P<h24>\d{1,2}):(?P<m24>\d{2})'
+)
+
+
+# Gemini models to try in order, after any GEMINI_MODEL override
+_DEFAULT_MODELS = (
+    'gemini-2.5-flash',  # Fast and free
+    'gemini-2.5-pro',    # Better quality
+    'gemini-pro',        # Legacy
+)
+
+# The model that answered the probe is remembered on disk so fresh
+# processes can skip the "Hi" round-trip
+_MODEL_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'doctor_connect', 'gemini_model')
+_MODEL_CACHE_TTL = 24 * 60 * 60  # seconds
+
+
+def _key_digest(api_key: str) -> str:
+    """Fingerprint an API key so the model cache never stores the key itself."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def _read_cached_model(api_key: str, candidates: Tuple[str, ...]) -> Optional[str]:
+    """Return the model resolved by a previous process, if still fresh."""
+    try:
+        with open(_MODEL_CACHE_FILE, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if (cached.get('key') != _key_digest(api_key)
+            or time.time() - cached.get('timestamp', 0) > _MODEL_CACHE_TTL
+            or cached.get('model') not in candidates):
+        return None
+    return cached['model']
+
+
+def _write_cached_model(api_key: str, model: str):
+    """Remember the resolved model for later processes (best effort)."""
+    try:
+        os.makedirs(os.path.dirname(_MODEL_CACHE_FILE), exist_ok=True)
+        with open(_MODEL_CACHE_FILE, 'w') as f:
+            json.dump({'key': _key_digest(api_key), 'model': model, 'timestamp': time.time()}, f)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=4)
+def _resolve_llm(api_key: str, candidates: Tuple[str, ...]) -> "ChatGoogleGenerativeAI":
+    """
+    Return a ready Gemini chat model, probing candidates in order.
+    
+    Results are cached per process, and the winning model name is cached on
+    disk, so only the first agent of a fresh install pays for the probe.
+    """
+    cached_model = _read_cached_model(api_key, candidates)
+    if cached_model:
+        logger.info("✓ Using Gemini model: %s", cached_model)
+        return ChatGoogleGenerativeAI(
+            model=cached_model,
+            temperature=0.7,
+            google_api_key=api_key
+        )
+    
+    last_error = None
+    for model in candidates:
+        try:
+            llm = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=0.7,
+                google_api_key=api_key
+            )
+            # Try a simple test to verify the model works
+            test_response = llm.invoke([HumanMessage(content="Hi")])
+            if test_response and hasattr(test_response, 'content'):
+                logger.info("✓ Using Gemini model: %s", model)
+                _write_cached_model(api_key, model)
+                return llm
+        except Exception as e:
+            last_error = e
+            if model != candidates[-1]:  # Don't print error for last attempt
+                logger.warning("⚠️  Model '%s' not available, trying next...", model)
+            continue
+    
+    error_msg = str(last_error) if last_error else "Unknown error"
+    raise ValueError(
+        f"\n❌ Could not initialize any Gemini model.\n"
+        f"Error: {error_msg}\n\n"
+        "🔧 SOLUTION: Enable Generative Language API\n\n"
+        "1. Go to: https://console.cloud.google.com/apis/library/generativelanguage.googleapis.com\n"
+        "2. Select your project (same one used for Calendar API)\n"
+        "3. Click 'Enable' button\n"
+        "4. Wait 10-30 seconds for it to enable\n"
+        "5. Run the application again\n\n"
+        "📖 See ENABLE_GEMINI_API.md for detailed instructions.\n"
+    )
+
+
+# Static instructions; the current time is added per turn in `_prepare_turn`
+# so the prompt prefix stays identical across sessions and never goes stale
+SYSTEM_PROMPT_TMPL = """You are a friendly and professional AI assistant helping patients book appointments with {doctor_name}. 
+
+Your role is to:
+1. Greet the patient warmly
+2. Collect the patient's name
+3. Ask about their symptoms or reason for visit
+4. Based on symptoms, recommend {doctor_name} as the best match
+5. Ask for their preferred date and time for the appointment
+6. Check availability and suggest alternatives if needed
+7. Confirm the appointment details before booking
+8. Be helpful, patient, and clear in your communication
+
+Guidelines:
+- Always be polite and professional
+- If a requested time is not available, suggest the next available slot
+- Always confirm appointment details before finalizing
+- Use natural, conversational language
+- If the user provides incomplete information, ask clarifying questions
+- Format dates and times clearly (e.g., "Monday, January 15th at 2:00 PM")
+- After collecting symptoms, always recommend {doctor_name} as the specialist for their condition
+"""
+
+
+# How dates are shown to the LLM and the patient
+_DATETIME_FORMAT = '%A, %B %d, %Y at %I:%M %p'
+
+
+def _format_datetime(dt: datetime) -> str:
+    """Format `dt` with `_DATETIME_FORMAT`; the same slot is shown on most turns."""
+    # Keyed on wall-clock time: aware datetimes compare equal across zones
+    return _format_wall_clock(dt.replace(tzinfo=None))
+
+
+@functools.lru_cache(maxsize=64)
+def _format_wall_clock(dt: datetime) -> str:
+    return dt.strftime(_DATETIME_FORMAT)
+
+
+# Prior messages sent with each turn, on top of the system prompt
+_MAX_HISTORY_MESSAGES = 40
+
+# Replies keyed by the exact prompt, shared by every agent in the process so
+# identical turns (e.g. the opening "Hello" of each fresh session) skip Gemini
+_RESPONSE_CACHE_SIZE = 256
+_response_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _cache_lookup(key: tuple) -> Optional[str]:
+    """Return the cached reply for `key`, if any."""
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            _response_cache.move_to_end(key)
+        return cached
+
+
+def _cache_store(key: tuple, response_text: str):
+    """Cache a reply, evicting the least recently used one when full."""
+    with _response_cache_lock:
+        _response_cache[key] = response_text
+        if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
 
 class AppointmentAgent:
     """AI agent for booking doctor appointments."""
@@ -38,6 +311,8 @@ class AppointmentAgent:
             doctor_name: Name of the doctor
             doctor_email: Email of the doctor
         """
+        _load_langchain()
+        
         self.calendar_service = calendar_service
         self.doctor_name = doctor_name
         self.doctor_email = doctor_email
@@ -51,61 +326,18 @@ class AppointmentAgent:
                 "Get your API key from: https://makersuite.google.com/app/apikey"
             )
         
-        # Use Gemini model - try different model names based on availability
-        # Common model names: gemini-1.5-flash, gemini-1.5-pro, gemini-pro
-        model_name = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+        # Use Gemini model - the user-specified model first, then the defaults
+        user_model = os.getenv('GEMINI_MODEL')
+        if not user_model or user_model == _DEFAULT_MODELS[0]:
+            models_to_try = _DEFAULT_MODELS
+        else:
+            models_to_try = (user_model,) + tuple(m for m in _DEFAULT_MODELS if m != user_model)
         
-        # List of models to try in order
-        models_to_try = [
-            model_name,  # Try user-specified first
-            'gemini-2.5-flash',  # Fast and free
-            'gemini-2.5-pro',    # Better quality
-            'gemini-pro',        # Legacy
-        ]
-        
-        # Remove duplicates while preserving order
-        models_to_try = list(dict.fromkeys(models_to_try))
-        
-        self.llm = None
-        last_error = None
-        
-        for model in models_to_try:
-            try:
-                self.llm = ChatGoogleGenerativeAI(
-                    model=model,
-                    temperature=0.7,
-                    google_api_key=api_key
-                )
-                # Try a simple test to verify the model works
-                test_response = self.llm.invoke([HumanMessage(content="Hi")])
-                if test_response and hasattr(test_response, 'content'):
-                    print(f"✓ Using Gemini model: {model}")
-                    break
-            except Exception as e:
-                last_error = e
-                if model != models_to_try[-1]:  # Don't print error for last attempt
-                    print(f"⚠️  Model '{model}' not available, trying next...")
-                continue
-        
-        if self.llm is None:
-            error_msg = str(last_error) if last_error else "Unknown error"
-            raise ValueError(
-                f"\n❌ Could not initialize any Gemini model.\n"
-                f"Error: {error_msg}\n\n"
-                "🔧 SOLUTION: Enable Generative Language API\n\n"
-                "1. Go to: https://console.cloud.google.com/apis/library/generativelanguage.googleapis.com\n"
-                "2. Select your project (same one used for Calendar API)\n"
-                "3. Click 'Enable' button\n"
-                "4. Wait 10-30 seconds for it to enable\n"
-                "5. Run the application again\n\n"
-                "📖 See ENABLE_GEMINI_API.md for detailed instructions.\n"
-            )
+        self.llm = _resolve_llm(api_key, models_to_try)
         
-        # Conversation memory - using simple list for compatibility
-        self.memory = ConversationBufferMemory(
-            return_messages=True,
-            memory_key="chat_history"
-        )
+        # Conversation memory - a sliding window of prior messages; the
+        # system prompt is kept separately so it never falls out
+        self._history = deque(maxlen=_MAX_HISTORY_MESSAGES)
         
         # Extract information during conversation
         self.extracted_info = {
@@ -118,53 +350,34 @@ class AppointmentAgent:
             'confirmed': False
         }
         
+        # Event returned by the calendar for the booking made in this conversation
+        self.last_event = None
+        
+        # (today, {date keyword: date}) for `_date_keywords`
+        self._today_context = None
+        
+        # (appointment datetime, its isoformat()) for `appointment_datetime_iso`
+        self._appointment_iso = None
+        
         # Conversation stage tracking
         self.conversation_stage = 'greeting'  # greeting -> name -> symptoms -> datetime -> confirmation -> completed
         
-        # System prompt
-        self.system_prompt = f"""You are a friendly and professional AI assistant helping patients book appointments with {doctor_name}. 
-
-Your role is to:
-1. Greet the patient warmly
-2. Collect the patient's name
-3. Ask about their symptoms or reason for visit
-4. Based on symptoms, recommend {doctor_name} as the best match
-5. Ask for their preferred date and time for the appointment
-6. Check availability and suggest alternatives if needed
-7. Confirm the appointment details before booking
-8. Be helpful, patient, and clear in your communication
-
-Guidelines:
-- Always be polite and professional
-- If a requested time is not available, suggest the next available slot
-- Always confirm appointment details before finalizing
-- Use natural, conversational language
-- If the user provides incomplete information, ask clarifying questions
-- Format dates and times clearly (e.g., "Monday, January 15th at 2:00 PM")
-- After collecting symptoms, always recommend {doctor_name} as the specialist for their condition
-
-Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
-"""
+        # System prompt - byte-identical for every session with this doctor;
+        # the current time is sent with each user turn instead
+        self.system_prompt = SYSTEM_PROMPT_TMPL.format(doctor_name=doctor_name)
         
         # Initialize conversation
         self._initialize_conversation()
     
     def _initialize_conversation(self):
         """Initialize the conversation with system message."""
-        self.memory.chat_memory.add_message(
-            SystemMessage(content=self.system_prompt)
-        )
+        self._system_msg = SystemMessage(content=self.system_prompt)
     
     def _extract_patient_name(self, message: str) -> Optional[str]:
         """Extract patient name from user message."""
         # Simple extraction - can be enhanced
-        patterns = [
-            r"(?:my name is|i'm|i am|call me)\s+([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)",
-            r"^([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)$"
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
+        for pattern in _NAME_PATS:
+            match = pattern.search(message)
             if match:
                 return match.group(1).strip()
         
@@ -173,48 +386,47 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
     def _extract_symptoms(self, message: str) -> Optional[str]:
         """Extract symptoms from user message."""
         # If message is long enough and doesn't look like a name or date, treat it as symptoms
-        if len(message) > 10 and not re.match(r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*$', message):
+        if len(message) > 10 and not _BARE_NAME_RE.match(message):
             return message.strip()
         return None
     
-    def _parse_datetime(self, message: str) -> Optional[datetime]:
-        """Parse date and time from natural language."""
-        message_lower = message.lower()
-        now = datetime.now()
-        tz = self.calendar_service.timezone
+    def _parse_datetime(self, message: str, msg_lower: Optional[str] = None) -> Optional[datetime]:
+        """
+        Parse date and time from natural language.
         
-        # Try to extract date and time
-        date_patterns = [
-            (r'today', now),
-            (r'tomorrow', now + timedelta(days=1)),
-            (r'monday|mon', self._next_weekday(now, 0)),
-            (r'tuesday|tue', self._next_weekday(now, 1)),
-            (r'wednesday|wed', self._next_weekday(now, 2)),
-            (r'thursday|thu', self._next_weekday(now, 3)),
-            (r'friday|fri', self._next_weekday(now, 4)),
-            (r'saturday|sat', self._next_weekday(now, 5)),
-            (r'sunday|sun', self._next_weekday(now, 6)),
-        ]
+        Tries a strict ISO-8601 string first, then the keyword/time patterns,
+        then dateparser for other phrasings ("next Monday", "the 15th at 2").
+        """
+        message_lower = msg_lower if msg_lower is not None else message.lower()
+        localize = self.calendar_service.localize
+        
+        # ISO-8601 fast path (e.g. "2024-01-15T14:30")
+        candidate = message.strip()
+        if len(candidate) >= 10 and candidate[4] == '-':
+            try:
+                iso_dt = ciso8601.parse_datetime(candidate)
+            except ValueError:
+                pass
+            else:
+                if len(candidate) == 10:
+                    # Date only, use default time (9 AM)
+                    iso_dt = iso_dt.replace(hour=9)
+                return iso_dt if iso_dt.tzinfo else localize(iso_dt)
         
+        # Try to extract date and time
         parsed_date = None
-        for pattern, date in date_patterns:
-            if re.search(pattern, message_lower):
-                parsed_date = date
-                break
+        match = _DATE_RE.search(message_lower)
+        if match:
+            parsed_date = self._date_keywords()[match.group(1)[:3]]
         
         # Extract time
-        time_patterns = [
-            (r'(\d{1,2}):(\d{2})\s*(am|pm)', self._parse_12h_time),
-            (r'(\d{1,2})\s*(am|pm)', self._parse_12h_time_simple),
-            (r'(\d{1,2}):(\d{2})', self._parse_24h_time),
-        ]
-        
         parsed_time = None
-        for pattern, parser in time_patterns:
-            match = re.search(pattern, message_lower)
-            if match:
-                parsed_time = parser(match)
-                break
+        match = _TIME_RE.search(message_lower)
+        if match:
+            parsed_time = self._parse_time(match)
+            if parsed_time is None:
+                # Not a time the patterns understand; let dateparser try
+                return self._parse_with_dateparser(message)
         
         if parsed_date and parsed_time:
             # Combine date and time
@@ -224,112 +436,179 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
                 second=0,
                 microsecond=0
             )
-            return tz.localize(appointment_dt)
+            return localize(appointment_dt)
         elif parsed_date:
             # Just date, use default time (9 AM)
             appointment_dt = parsed_date.replace(hour=9, minute=0, second=0, microsecond=0)
-            return tz.localize(appointment_dt)
+            return localize(appointment_dt)
         
-        return None
-    
-    def _next_weekday(self, d: datetime, weekday: int) -> datetime:
-        """Get next occurrence of a weekday."""
-        days_ahead = weekday - d.weekday()
-        if days_ahead <= 0:
-            days_ahead += 7
-        return d + timedelta(days=days_ahead)
+        return self._parse_with_dateparser(message)
     
-    def _parse_12h_time(self, match) -> datetime:
-        """Parse 12-hour time format."""
-        hour = int(match.group(1))
-        minute = int(match.group(2)) if match.group(2) else 0
-        period = match.group(3).lower()
+    def _parse_with_dateparser(self, message: str) -> Optional[datetime]:
+        """
+        Parse phrasings the patterns don't cover.
         
-        if period == 'pm' and hour != 12:
-            hour += 12
-        elif period == 'am' and hour == 12:
-            hour = 0
+        Only results with an explicit time, a date token or a relative time
+        in the message are accepted, and only within the next
+        `_MAX_DAYS_AHEAD` days; anything else (e.g. "ok", "10") is None, as
+        is every message when dateparser isn't installed.
+        """
+        parser = _get_date_parser(str(self.calendar_service.timezone))
+        if parser is None:
+            return None
         
-        return datetime(1900, 1, 1, hour, minute)
+        message_lower = message.lower()
+        date_data = parser.get_date_data(_BARE_HOUR_RE.sub(_expand_bare_hour, message_lower))
+        if date_data is None or date_data.date_obj is None:
+            return None
+        
+        appointment_dt = date_data.date_obj.astimezone(self.calendar_service.timezone)
+        if date_data.period == 'day' and _RELATIVE_TIME_RE.search(message_lower):
+            pass  # "in 2 hours": keep the computed time
+        elif date_data.period == 'day' and _DATE_TOKEN_RE.search(message_lower):
+            # Just date, use default time (9 AM)
+            appointment_dt = appointment_dt.replace(hour=9, minute=0)
+        elif date_data.period != 'time':
+            return None
+        appointment_dt = appointment_dt.replace(second=0, microsecond=0)
+        
+        now = datetime.now(self.calendar_service.timezone)
+        if not now <= appointment_dt <= now + timedelta(days=_MAX_DAYS_AHEAD):
+            return None
+        return appointment_dt
     
-    def _parse_12h_time_simple(self, match) -> datetime:
-        """Parse simple 12-hour time format."""
-        hour = int(match.group(1))
-        period = match.group(2).lower()
+    def _date_keywords(self) -> Dict[str, datetime]:
+        """Map each `_DATE_RE` token to its date; rebuilt only when the day changes."""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if self._today_context is None or self._today_context[0] != today:
+            weekday_today = today.weekday()
+            dates = {'tod': today, 'tom': today + _ONE_DAY}
+            for token, weekday in _WEEKDAYS.items():
+                # Next occurrence, a week out if it's today
+                dates[token] = today + timedelta(days=(weekday - weekday_today) % 7 or 7)
+            self._today_context = (today, dates)
+        return self._today_context[1]
+    
+    def _parse_time(self, match) -> Optional[datetime]:
+        """Parse a `_TIME_RE` match in 12-hour or 24-hour format; None if out of range."""
+        if match.group('h12'):
+            hour, minute, period = int(match.group('h12')), int(match.group('m12')), match.group('ap')
+        elif match.group('h'):
+            hour, minute, period = int(match.group('h')), 0, match.group('ap2')
+        else:
+            hour, minute, period = int(match.group('h24')), int(match.group('m24')), None
         
         if period == 'pm' and hour != 12:
             hour += 12
         elif period == 'am' and hour == 12:
             hour = 0
         
-        return datetime(1900, 1, 1, hour, 0)
-    
-    def _parse_24h_time(self, match) -> datetime:
-        """Parse 24-hour time format."""
-        hour = int(match.group(1))
-        minute = int(match.group(2)) if match.group(2) else 0
+        # e.g. "13pm", "24:00", or the "30am" in "10.30am"
+        if hour > 23 or minute > 59:
+            return None
         return datetime(1900, 1, 1, hour, minute)
     
-    def _update_extracted_info(self, message: str):
-        """Update extracted information from user message."""
+    def _update_extracted_info(self, message: str, msg_lower: Optional[str] = None):
+        """
+        Update extracted information from user message.
+        
+        Only the extractor for the current stage runs; when it succeeds the
+        same message falls through to the next stage's extractor.
+        `msg_lower` is the lowercased message, if the caller already has it.
+        """
+        stage = self.conversation_stage
+        
         # Extract patient name
-        if not self.extracted_info['patient_name']:
+        if stage in ('greeting', 'name'):
             name = self._extract_patient_name(message)
-            if name:
-                self.extracted_info['patient_name'] = name
-                self.conversation_stage = 'symptoms'
+            if not name:
+                return
+            self.extracted_info['patient_name'] = name
+            stage = self.conversation_stage = 'symptoms'
         
         # Extract symptoms
-        if self.extracted_info['patient_name'] and not self.extracted_info['symptoms']:
+        if stage == 'symptoms':
             symptoms = self._extract_symptoms(message)
-            if symptoms:
-                self.extracted_info['symptoms'] = symptoms
-                self.extracted_info['doctor_assigned'] = True
-                self.conversation_stage = 'datetime'
+            if not symptoms:
+                return
+            self.extracted_info['symptoms'] = symptoms
+            self.extracted_info['doctor_assigned'] = True
+            stage = self.conversation_stage = 'datetime'
         
         # Extract date/time
-        if self.extracted_info['doctor_assigned'] and not self.extracted_info['appointment_datetime']:
-            dt = self._parse_datetime(message)
+        if stage == 'datetime':
+            dt = self._parse_datetime(message, msg_lower)
             if dt:
                 self.extracted_info['appointment_datetime'] = dt
                 self.conversation_stage = 'confirmation'
+        
+        # 'confirmation' and 'completed' have nothing left to extract
     
-    def _check_availability_and_suggest(self, preferred_dt: datetime) -> Tuple[bool, Optional[datetime], List[datetime]]:
+    def _check_availability_and_suggest(self, preferred_dt: datetime,
+                                        fresh: bool = False) -> Tuple[bool, Optional[datetime], List[datetime]]:
         """
         Check availability and suggest alternatives.
         
+        Args:
+            preferred_dt: Requested appointment time
+            fresh: Bypass the calendar's short-lived freebusy cache
+        
         Returns:
             (is_available, suggested_datetime, available_slots)
         """
-        # Check for conflict
-        has_conflict = self.calendar_service.check_conflict(preferred_dt)
+        # Conflict, the day's free slots and the next opening from one query
+        snapshot = self.calendar_service.day_snapshot(preferred_dt, fresh=fresh)
         
-        if not has_conflict:
-            # Check if within business hours (9 AM - 5 PM)
-            hour = preferred_dt.hour
-            if 9 <= hour < 17:
+        if not snapshot['conflict']:
+            # Check if within the calendar's business hours and working days
+            if self.calendar_service.is_working_time(preferred_dt):
                 return (True, preferred_dt, [preferred_dt])
         
-        # Get available slots for the day
-        available_slots = self.calendar_service.get_available_slots(preferred_dt)
-        
-        # Suggest next available
-        suggested = self.calendar_service.suggest_next_available(preferred_dt)
+        return (False, snapshot['next_available'], snapshot['slots'][:5])  # Return top 5 slots
+    
+    def _cache_key(self, messages: List[Any]) -> tuple:
+        """
+        Key for `_response_cache`: conversation stage plus the prompt.
         
-        return (False, suggested, available_slots[:5])  # Return top 5 slots
+        The `[Now: ...]` line that `_prepare_turn` puts first in the last
+        message changes every minute, so it is left out; otherwise the same
+        opening turn of each fresh session would never hit the cache. The
+        current date and hour go in instead, so replies that depend on the
+        time ("Good morning", "tomorrow, October 15th") aren't replayed later.
+        """
+        *earlier, last = messages
+        return ((self.conversation_stage, datetime.now().strftime('%Y-%m-%d %H'))
+                + tuple((m.type, m.content) for m in earlier)
+                + ((last.type, last.content.partition('\n')[2]),))
     
-    def chat(self, user_message: str) -> str:
+    async def _ainvoke_llm(self, messages: List[Any]) -> str:
+        """Get the LLM reply for `messages`, reusing the reply to an identical prompt."""
+        key = self._cache_key(messages)
+        cached = _cache_lookup(key)
+        if cached is not None:
+            return cached
+        
+        response = await self.llm.ainvoke(messages)
+        _cache_store(key, response.content)
+        return response.content
+    
+    def _prepare_turn(self, user_message: str) -> Tuple[Optional[str], Optional[List[Any]]]:
         """
-        Process user message and return agent response.
+        Run the part of a turn that comes before the LLM call.
         
         Args:
             user_message: User's input message
         
         Returns:
-            Agent's response
+            (reply, messages) - reply is set when the turn was answered
+            without the LLM (booking result); otherwise messages is the
+            live history, ending with the queued user turn, to send
         """
+        # Lowercase once for every case-insensitive check in this turn
+        msg_lower = user_message.lower()
+        
         # Update extracted information
-        self._update_extracted_info(user_message)
+        self._update_extracted_info(user_message, msg_lower)
         
         # Add context about extracted information
         context = ""
@@ -340,51 +619,52 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
             context += f"Doctor assigned: {self.doctor_name}\n"
         if self.extracted_info['appointment_datetime']:
             dt = self.extracted_info['appointment_datetime']
-            context += f"Requested appointment time: {dt.strftime('%A, %B %d, %Y at %I:%M %p')}\n"
+            context += f"Requested appointment time: {_format_datetime(dt)}\n"
+        
+        # A turn that books must see the calendar as it is now, not a cached
+        # freebusy result that another client may have changed since
+        booking = bool(not self.extracted_info['confirmed']
+                       and _CONFIRM_RE.search(msg_lower)
+                       and self.extracted_info['appointment_datetime']
+                       and self.extracted_info['patient_name'])
         
         # Check availability if we have a datetime
+        # Computed once per turn; the confirmation branch below reuses it
         availability_info = ""
+        availability = None
         if self.extracted_info['appointment_datetime'] and not self.extracted_info['confirmed']:
             preferred_dt = self.extracted_info['appointment_datetime']
-            is_available, suggested, slots = self._check_availability_and_suggest(preferred_dt)
+            availability = self._check_availability_and_suggest(preferred_dt, fresh=booking)
+            is_available, suggested, slots = availability
             
             if is_available:
-                availability_info = f"\nThe requested time ({preferred_dt.strftime('%A, %B %d, %Y at %I:%M %p')}) is available!\n"
+                availability_info = f"\nThe requested time ({_format_datetime(preferred_dt)}) is available!\n"
             else:
                 availability_info = f"\nThe requested time is not available. "
                 if suggested:
-                    availability_info += f"Next available slot: {suggested.strftime('%A, %B %d, %Y at %I:%M %p')}\n"
+                    availability_info += f"Next available slot: {_format_datetime(suggested)}\n"
                 if slots:
-                    availability_info += f"Available slots today: {', '.join([s.strftime('%I:%M %p') for s in slots[:3]])}\n"
-        
-        # Build messages for LLM
-        messages = self.memory.chat_memory.messages.copy()
-        messages.append(HumanMessage(content=user_message))
-        
-        # Add context to the last message
-        if context or availability_info:
-            enhanced_message = user_message + "\n\n[Context]" + context + availability_info
-            messages[-1] = HumanMessage(content=enhanced_message)
+                    slots_str = ', '.join(s.strftime('%I:%M %p') for s in slots[:3])
+                    availability_info += f"Available slots today: {slots_str}\n"
         
         # Check if user confirmed the appointment FIRST (before LLM response)
         # This ensures booking happens before the AI generates a response
         if not self.extracted_info['confirmed']:
-            confirmation_keywords = ['yes', 'confirm', 'book it', 'schedule', 'that works', 'ok', 'sure', 'proceed', 'go ahead']
-            if any(word in user_message.lower() for word in confirmation_keywords):
+            if _CONFIRM_RE.search(msg_lower):
                 if self.extracted_info['appointment_datetime'] and self.extracted_info['patient_name']:
                     # Book the appointment FIRST
                     try:
                         suggested_dt = self.extracted_info['appointment_datetime']
-                        is_available, alternative_dt, _ = self._check_availability_and_suggest(suggested_dt)
+                        is_available, alternative_dt, _ = availability
                         
                         if is_available:
                             final_dt = suggested_dt
                         elif alternative_dt:
                             final_dt = alternative_dt
                         else:
-                            return "I'm sorry, but I couldn't find an available time slot. Please try a different date or time."
+                            return "I'm sorry, but I couldn't find an available time slot. Please try a different date or time.", None
                         
-                        print(f"Attempting to create appointment for {self.extracted_info['patient_name']} at {final_dt}")
+                        logger.info("Attempting to create appointment for %s at %s", self.extracted_info['patient_name'], final_dt)
                         event = self.calendar_service.create_appointment(
                             patient_name=self.extracted_info['patient_name'],
                             appointment_time=final_dt,
@@ -397,6 +677,8 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
                             raise Exception("Event was not created - no event ID returned")
                         
                         self.extracted_info['confirmed'] = True
+                        self.conversation_stage = 'completed'
+                        self.last_event = event
                         
                         # Get event details for confirmation
                         event_id = event.get('id', 'N/A')
@@ -407,7 +689,7 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
                         response_text = (
                             f"✅ Appointment confirmed!\n\n"
                             f"Patient: {self.extracted_info['patient_name']}\n"
-                            f"Date & Time: {final_dt.strftime('%A, %B %d, %Y at %I:%M %p')}\n"
+                            f"Date & Time: {_format_datetime(final_dt)}\n"
                             f"Doctor: {self.doctor_name}\n"
                             f"Calendar: {calendar_id}\n"
                             f"Event ID: {event_id}\n\n"
@@ -423,34 +705,115 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
                         )
                         
                         # Update memory and return immediately
-                        self.memory.chat_memory.add_message(HumanMessage(content=user_message))
-                        self.memory.chat_memory.add_message(AIMessage(content=response_text))
-                        return response_text
+                        self._record_turn(user_message, response_text)
+                        return response_text, None
                     except Exception as e:
-                        import traceback
-                        error_trace = traceback.format_exc()
-                        print(f"ERROR creating appointment: {e}")
-                        print(f"Traceback: {error_trace}")
+                        logger.exception("ERROR creating appointment: %s", e)
                         response_text = f"I apologize, but there was an error booking your appointment: {str(e)}\n\nPlease try again or contact support."
                         # Update memory and return error
-                        self.memory.chat_memory.add_message(HumanMessage(content=user_message))
-                        self.memory.chat_memory.add_message(AIMessage(content=response_text))
-                        return response_text
+                        self._record_turn(user_message, response_text)
+                        return response_text, None
+        
+        # Build messages for LLM; history only takes the plain user message
+        # once the reply is in, so a failed call leaves it untouched
+        prompt = f"[Now: {datetime.now().strftime(_DATETIME_FORMAT)}]\n{user_message}"
+        if context or availability_info:
+            prompt += "\n\n[Context]" + context + availability_info
+        
+        return None, [self._system_msg, *self._history, HumanMessage(content=prompt)]
+    
+    def _record_turn(self, user_message: str, response_text: str):
+        """Store a completed exchange in the conversation memory."""
+        # The deque drops the oldest messages once the window is full
+        self._history.append(HumanMessage(content=user_message))
+        self._history.append(AIMessage(content=response_text))
+    
+    def chat(self, user_message: str) -> str:
+        """
+        Process user message and return agent response.
+        
+        Args:
+            user_message: User's input message
+        
+        Returns:
+            Agent's response
+        """
+        return "".join(self.chat_stream(user_message))
+    
+    def chat_stream(self, user_message: str) -> Iterator[str]:
+        """
+        Process user message and yield the agent response as it is generated.
+        
+        Booking results and cached replies are yielded in one piece; LLM
+        replies are streamed token by token so callers can show them early.
+        
+        Args:
+            user_message: User's input message
+        
+        Yields:
+            Chunks of the agent's response
+        """
+        reply, messages = self._prepare_turn(user_message)
+        if reply is not None:
+            yield reply
+            return
+        
+        key = self._cache_key(messages)
+        cached = _cache_lookup(key)
+        if cached is not None:
+            self._record_turn(user_message, cached)
+            yield cached
+            return
         
-        # Get response from LLM (using invoke instead of deprecated __call__)
         # Only call LLM if we haven't already handled booking
-        response = self.llm.invoke(messages)
-        response_text = response.content
+        chunks = []
+        for chunk in self.llm.stream(messages):
+            if chunk.content:
+                chunks.append(chunk.content)
+                yield chunk.content
+        
+        response_text = "".join(chunks)
+        _cache_store(key, response_text)
+        self._record_turn(user_message, response_text)
+    
+    async def achat(self, user_message: str) -> str:
+        """
+        Async version of `chat`.
         
-        # Update memory
-        self.memory.chat_memory.add_message(HumanMessage(content=user_message))
-        self.memory.chat_memory.add_message(AIMessage(content=response_text))
+        The calendar lookups run in the default executor and the LLM call
+        uses `ainvoke`, so concurrent sessions don't block each other.
+        """
+        loop = asyncio.get_running_loop()
+        reply, messages = await loop.run_in_executor(None, self._prepare_turn, user_message)
+        if reply is not None:
+            return reply
         
+        response_text = await self._ainvoke_llm(messages)
+        self._record_turn(user_message, response_text)
         return response_text
     
+    def appointment_datetime_iso(self) -> Optional[str]:
+        """
+        Return the extracted appointment datetime as an ISO 8601 string.
+        
+        The string is formatted once per extracted value and reused on the
+        following turns.
+        
+        Returns:
+            ISO 8601 string, or None if no datetime has been extracted yet
+        """
+        dt = self.extracted_info.get('appointment_datetime')
+        if dt is None:
+            return None
+        
+        cached = self._appointment_iso
+        if cached is None or cached[0] is not dt:
+            cached = self._appointment_iso = (dt, dt.isoformat())
+        return cached[1]
+    
     def reset(self):
         """Reset the conversation and extracted information."""
-        self.memory.clear()
+        self._history.clear()
         self.extracted_info = {
             'patient_name': None,
             'symptoms': None,
@@ -460,6 +823,36 @@ Current date and time: {datetime.now().strftime('%A, %B %d, %Y at %I:%M %p')}
             'doctor_assigned': False,
             'confirmed': False
         }
+        self.last_event = None
+        self._appointment_iso = None
         self.conversation_stage = 'greeting'
         self._initialize_conversation()
 
+
+async def chat_batch(sessions: Dict[str, AppointmentAgent],
+                     user_messages: List[Tuple[str, str]]) -> List[str]:
+    """
+    Answer messages from many sessions concurrently.
+    
+    Messages for the same session are processed in order; different
+    sessions run in parallel.
+    
+    Args:
+        sessions: Agent for each session ID
+        user_messages: (session_id, message) pairs
+    
+    Returns:
+        Replies in the same order as user_messages
+    """
+    replies: List[Optional[str]] = [None] * len(user_messages)
+    by_session: Dict[str, List[Tuple[int, str]]] = OrderedDict()
+    for index, (session_id, message) in enumerate(user_messages):
+        by_session.setdefault(session_id, []).append((index, message))
+    
+    async def run_session(session_id: str, items: List[Tuple[int, str]]):
+        agent = sessions[session_id]
+        for index, message in items:
+            replies[index] = await agent.achat(message)
+    
+    await asyncio.gather(*(run_session(sid, items) for sid, items in by_session.items()))
+    return replies
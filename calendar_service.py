@@ -4,15 +4,155 @@ Handles OAuth authentication, calendar operations, and appointment management.
 """
 
 import os
-import pickle
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+import sys
+import asyncio
+import bisect
+import functools
+import json
+import logging
+import math
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Tuple, Union, Iterable
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import pytz
+from googleapiclient.http import BatchHttpRequest
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    # Python 3.8: same API from the backport
+    from backports.zoneinfo import ZoneInfo
+
+
+@functools.lru_cache(maxsize=32)
+def _get_timezone(name: str) -> ZoneInfo:
+    """ZoneInfo for name, memoized."""
+    return ZoneInfo(name)
+
+
+logger = logging.getLogger(__name__)
+
+
+# fromisoformat accepts a trailing 'Z' from Python 3.11 on
+if sys.version_info >= (3, 11):
+    _parse_iso = datetime.fromisoformat
+else:
+    def _parse_iso(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+# Authorized API clients keyed by (credentials file, token file), so a new
+# CalendarService reuses the built client instead of building it again
+_SERVICE_CACHE: Dict[Tuple[str, str], Tuple[Any, Any, "queue.LifoQueue"]] = {}
+
+# Cached clients share one Credentials object across request threads; this
+# makes a near-expiry refresh (and the token file write) happen once
+_CREDS_REFRESH_LOCK = threading.Lock()
+
+# httplib2.Http is not thread-safe, so requests borrow a keep-alive
+# connection from a small per-client pool instead of sharing one
+_HTTP_POOL_SIZE = 16
+_HTTP_TIMEOUT = 30
+
+# Retries (with exponential backoff) for transient errors on read requests
+_HTTP_RETRIES = 3
+
+# Calendar API limit on requests per batch
+_BATCH_LIMIT = 50
+
+# Only the event fields callers read, and the largest page the API allows
+_EVENT_ITEM_FIELDS = 'id,summary,start,end,htmlLink'
+_EVENT_FIELDS = f'items({_EVENT_ITEM_FIELDS}),nextPageToken'
+_EVENTS_PAGE_SIZE = 2500
+
+# How long get_events/_get_busy results are reused (seconds)
+_EVENTS_CACHE_TTL = 30
+_EVENTS_CACHE_MAX_ENTRIES = 128
+
+# Refresh OAuth tokens this long before they expire
+_REFRESH_MARGIN = timedelta(minutes=5)
+
+_ONE_DAY = timedelta(days=1)
+
+
+# Guidance shown when credentials.json is missing or of the wrong kind
+_ERR_BAD_FORMAT = (
+    "Invalid credentials file format. The file must contain either "
+    "'installed' (for Desktop app) or 'web' (for Web app) key.\n"
+    "Please ensure you downloaded the correct OAuth 2.0 Client ID "
+    "credentials from Google Cloud Console.\n"
+    "For Desktop app, choose 'Desktop app' as the application type."
+)
+_ERR_WEB_APP = (
+    "The credentials file is for a 'Web application', but this app "
+    "requires 'Desktop app' credentials.\n"
+    "Please create new OAuth 2.0 credentials in Google Cloud Console:\n"
+    "1. Go to APIs & Services > Credentials\n"
+    "2. Click 'Create Credentials' > 'OAuth client ID'\n"
+    "3. Choose 'Desktop app' as the application type\n"
+    "4. Download the new credentials file"
+)
+_ERR_BAD_JSON = (
+    "Invalid JSON in credentials file '{path}'. "
+    "Please ensure the file is a valid JSON file downloaded from "
+    "Google Cloud Console."
+)
+_ERR_NOT_INSTALLED = (
+    "Invalid credentials file format.\n\n"
+    "The credentials.json file must be for a 'Desktop app' (installed app).\n\n"
+    "To fix this:\n"
+    "1. Go to https://console.cloud.google.com/\n"
+    "2. Navigate to APIs & Services > Credentials\n"
+    "3. Click 'Create Credentials' > 'OAuth client ID'\n"
+    "4. IMPORTANT: Select 'Desktop app' as the application type\n"
+    "5. Click 'Create' and download the JSON file\n"
+    "6. Replace your current credentials.json with the new file\n\n"
+    "Current file location: {path}"
+)
+
+
+def _validate_credentials_file(path: str):
+    """
+    Check that the OAuth client file is Desktop-app JSON before starting the
+    consent flow. Only needed when there is no usable token.
+    
+    Raises:
+        ValueError: If the file is not valid JSON or not 'installed' credentials
+    """
+    try:
+        with open(path, 'r') as f:
+            creds_data = json.load(f)
+    except json.JSONDecodeError:
+        raise ValueError(_ERR_BAD_JSON.format(path=path))
+    except OSError:
+        # Let the OAuth flow report unreadable files
+        return
+    
+    # Check if it's the correct format for installed app
+    if not isinstance(creds_data, dict) or ('installed' not in creds_data and 'web' not in creds_data):
+        raise ValueError(_ERR_BAD_FORMAT)
+    
+    # If it's a web app, provide helpful message
+    if 'web' in creds_data and 'installed' not in creds_data:
+        raise ValueError(_ERR_WEB_APP)
+
+
+def _needs_refresh(creds) -> bool:
+    """True if creds are invalid or expire within _REFRESH_MARGIN."""
+    if not creds.valid:
+        return True
+    # google-auth keeps expiry as naive UTC
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return creds.expiry is not None and creds.expiry - now < _REFRESH_MARGIN
 
 
 class CalendarService:
@@ -21,9 +161,11 @@ class CalendarService:
     SCOPES = ['https://www.googleapis.com/auth/calendar']
     
     def __init__(self, credentials_file: str = 'credentials.json', 
-                 token_file: str = 'token.pickle',
+                 token_file: str = 'token.json',
                  calendar_id: str = 'primary',
-                 timezone: str = 'America/New_York'):
+                 timezone: str = 'America/New_York',
+                 start_hour: int = 9, end_hour: int = 17,
+                 working_days: Optional[Iterable[int]] = None):
         """
         Initialize the Calendar Service.
         
@@ -32,161 +174,381 @@ class CalendarService:
             token_file: Path to store OAuth token
             calendar_id: Google Calendar ID to use
             timezone: Timezone for appointments
+            start_hour: Start of business hours (24-hour format)
+            end_hour: End of business hours (24-hour format)
+            working_days: Weekdays open for booking (Monday=0); all days if None
         """
         self.credentials_file = credentials_file
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.working_days = frozenset(range(7) if working_days is None else working_days)
         self.token_file = token_file
         self.calendar_id = calendar_id
-        self.timezone = pytz.timezone(timezone)
+        self.timezone = _get_timezone(timezone)
+        # Fixed parts of every appointment event; create_appointment fills in the rest
+        self._event_template = {
+            'start': {'timeZone': timezone},
+            'end': {'timeZone': timezone},
+        }
         self.service = None
+        self._creds = None
+        self._http_pool = None
+        # (kind, time_min, time_max) -> (fetched_at, time_min, time_max, result)
+        self._events_cache: Dict[tuple, tuple] = {}
+        self._events_cache_lock = threading.Lock()
         self._authenticate()
     
     def _authenticate(self):
         """Authenticate with Google Calendar API using OAuth."""
+        cache_key = (os.path.abspath(self.credentials_file), os.path.abspath(self.token_file))
+        cached = _SERVICE_CACHE.get(cache_key)
+        if cached and cached[0].valid:
+            self._creds, self.service, self._http_pool = cached
+            self._ensure_fresh_credentials()
+            return
+        
         creds = None
         
         # Load existing token if available
+        if not os.path.exists(self.token_file):
+            self._migrate_pickle_token()
+        
         if os.path.exists(self.token_file):
             try:
-                with open(self.token_file, 'rb') as token:
-                    creds = pickle.load(token)
+                with open(self.token_file, 'r') as token:
+                    creds = Credentials.from_authorized_user_info(json.load(token), self.SCOPES)
             except Exception as e:
-                print(f"Warning: Could not load existing token: {e}")
+                logger.warning("Warning: Could not load existing token: %s", e)
                 creds = None
         
+        # Refresh ahead of expiry so no API call runs into a 401 and a
+        # refresh round-trip mid-request
+        token_changed = False
+        if creds and creds.refresh_token and _needs_refresh(creds):
+            try:
+                creds.refresh(Request())
+                token_changed = True
+            except Exception as e:
+                logger.warning("Warning: Could not refresh token: %s", e)
+                if not creds.valid:
+                    creds = None
+        
         # If there are no valid credentials, request authorization
         if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                try:
-                    creds.refresh(Request())
-                except Exception as e:
-                    print(f"Warning: Could not refresh token: {e}")
-                    creds = None
+            if not os.path.exists(self.credentials_file):
+                raise FileNotFoundError(
+                    f"Credentials file '{self.credentials_file}' not found. "
+                    "Please download it from Google Cloud Console."
+                )
             
-            if not creds or not creds.valid:
-                if not os.path.exists(self.credentials_file):
-                    raise FileNotFoundError(
-                        f"Credentials file '{self.credentials_file}' not found. "
-                        "Please download it from Google Cloud Console."
-                    )
-                
-                # Validate credentials file format
-                try:
-                    import json
-                    with open(self.credentials_file, 'r') as f:
-                        creds_data = json.load(f)
-                    
-                    # Check if it's the correct format for installed app
-                    if 'installed' not in creds_data and 'web' not in creds_data:
-                        raise ValueError(
-                            "Invalid credentials file format. The file must contain either "
-                            "'installed' (for Desktop app) or 'web' (for Web app) key.\n"
-                            "Please ensure you downloaded the correct OAuth 2.0 Client ID "
-                            "credentials from Google Cloud Console.\n"
-                            "For Desktop app, choose 'Desktop app' as the application type."
-                        )
-                    
-                    # If it's a web app, provide helpful message
-                    if 'web' in creds_data and 'installed' not in creds_data:
-                        raise ValueError(
-                            "The credentials file is for a 'Web application', but this app "
-                            "requires 'Desktop app' credentials.\n"
-                            "Please create new OAuth 2.0 credentials in Google Cloud Console:\n"
-                            "1. Go to APIs & Services > Credentials\n"
-                            "2. Click 'Create Credentials' > 'OAuth client ID'\n"
-                            "3. Choose 'Desktop app' as the application type\n"
-                            "4. Download the new credentials file"
-                        )
-                except json.JSONDecodeError:
+            # Validate credentials file format
+            _validate_credentials_file(self.credentials_file)
+            
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    self.credentials_file, self.SCOPES
+                )
+                creds = flow.run_local_server(port=0)
+            except ValueError as e:
+                if "Client secrets must be for a web or installed app" in str(e):
                     raise ValueError(
-                        f"Invalid JSON in credentials file '{self.credentials_file}'. "
-                        "Please ensure the file is a valid JSON file downloaded from "
-                        "Google Cloud Console."
-                    )
-                except Exception as e:
-                    if isinstance(e, (ValueError, FileNotFoundError)):
-                        raise
-                    # If validation fails for other reasons, continue anyway
-                    pass
-                
-                try:
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        self.credentials_file, self.SCOPES
-                    )
-                    creds = flow.run_local_server(port=0)
-                except ValueError as e:
-                    if "Client secrets must be for a web or installed app" in str(e):
-                        raise ValueError(
-                            "Invalid credentials file format.\n\n"
-                            "The credentials.json file must be for a 'Desktop app' (installed app).\n\n"
-                            "To fix this:\n"
-                            "1. Go to https://console.cloud.google.com/\n"
-                            "2. Navigate to APIs & Services > Credentials\n"
-                            "3. Click 'Create Credentials' > 'OAuth client ID'\n"
-                            "4. IMPORTANT: Select 'Desktop app' as the application type\n"
-                            "5. Click 'Create' and download the JSON file\n"
-                            "6. Replace your current credentials.json with the new file\n\n"
-                            f"Current file location: {os.path.abspath(self.credentials_file)}"
-                        ) from e
-                    raise
+                        _ERR_NOT_INSTALLED.format(path=os.path.abspath(self.credentials_file))
+                    ) from e
+                raise
             
-            # Save credentials for future use
-            if creds:
-                with open(self.token_file, 'wb') as token:
-                    pickle.dump(creds, token)
+            token_changed = True
         
-        self.service = build('calendar', 'v3', credentials=creds)
+        # Save credentials for future use
+        if creds and token_changed:
+            self._save_token(creds)
+        
+        # The discovery document ships with googleapiclient; no HTTP fetch
+        self.service = build('calendar', 'v3', http=self._new_http(creds), static_discovery=True)
+        self._creds = creds
+        self._http_pool = queue.LifoQueue(maxsize=_HTTP_POOL_SIZE)
+        _SERVICE_CACHE[cache_key] = (creds, self.service, self._http_pool)
+    
+    @staticmethod
+    def _new_http(creds) -> AuthorizedHttp:
+        """Create an authorized httplib2 client that keeps its connections open."""
+        return AuthorizedHttp(creds, http=httplib2.Http(timeout=_HTTP_TIMEOUT))
+    
+    def _execute(self, request, num_retries: int = _HTTP_RETRIES):
+        """
+        Execute an API request (or batch) on a pooled connection.
+        
+        LIFO order hands out the most recently used, still-open connection,
+        so sequential calls skip the TCP/TLS handshake.
+        
+        Args:
+            request: HttpRequest or BatchHttpRequest
+            num_retries: Retries on 5xx/429 and connection errors (single
+                requests only; batches are sent once)
+        """
+        try:
+            http = self._http_pool.get_nowait()
+        except queue.Empty:
+            http = self._new_http(self._creds)
+        try:
+            if isinstance(request, BatchHttpRequest):
+                return request.execute(http=http)
+            return request.execute(http=http, num_retries=num_retries)
+        finally:
+            try:
+                self._http_pool.put_nowait(http)
+            except queue.Full:
+                pass
+    
+    def _save_token(self, creds):
+        """
+        Persist the OAuth token to token_file.
+        
+        Written to a temporary file first and moved into place, so a reader
+        never sees a half-written token.
+        """
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(creds.to_json())
+            os.replace(tmp_path, self.token_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _migrate_pickle_token(self):
+        """Convert a token.pickle left by older versions into token_file, once."""
+        legacy_file = os.path.splitext(self.token_file)[0] + '.pickle'
+        if legacy_file == self.token_file or not os.path.exists(legacy_file):
+            return
+        try:
+            import pickle
+            with open(legacy_file, 'rb') as token:
+                creds = pickle.load(token)
+            self._save_token(creds)
+            os.remove(legacy_file)
+            logger.info("Migrated OAuth token from %s to %s", legacy_file, self.token_file)
+        except Exception as e:
+            logger.warning("Warning: Could not migrate %s: %s", legacy_file, e)
+    
+    def _ensure_fresh_credentials(self):
+        """Refresh the token shortly before it expires (long-running servers)."""
+        creds = self._creds
+        if creds is None or not creds.refresh_token or not _needs_refresh(creds):
+            return
+        with _CREDS_REFRESH_LOCK:
+            # Another thread may have refreshed while this one waited
+            if not _needs_refresh(creds):
+                return
+            try:
+                creds.refresh(Request())
+                self._save_token(creds)
+            except Exception as e:
+                logger.warning("Warning: Could not refresh token: %s", e)
     
     def get_available_slots(self, date: datetime, duration_minutes: int = 30,
-                           start_hour: int = 9, end_hour: int = 17) -> List[datetime]:
+                           start_hour: Optional[int] = None,
+                           end_hour: Optional[int] = None) -> List[datetime]:
         """
         Get available time slots for a given date.
         
         Args:
             date: Date to check availability
             duration_minutes: Duration of each appointment slot
-            start_hour: Start hour (24-hour format)
-            end_hour: End hour (24-hour format)
+            start_hour: Start hour (24-hour format), defaults to self.start_hour
+            end_hour: End hour (24-hour format), defaults to self.end_hour
         
         Returns:
             List of available datetime slots
         """
+        start_hour, end_hour = self._hours(start_hour, end_hour)
+        if date.weekday() not in self.working_days:
+            return []
+        
         # Get existing events for the date
-        start_of_day = self.timezone.localize(
-            datetime.combine(date.date(), datetime.min.time().replace(hour=start_hour))
+        start_of_day, end_of_day = self._day_bounds(date, start_hour, end_hour)
+        
+        busy = self._get_busy(start_of_day, end_of_day)
+        
+        return self._available_slots_from_events(
+            busy, start_of_day, end_of_day, duration_minutes
         )
-        end_of_day = self.timezone.localize(
-            datetime.combine(date.date(), datetime.min.time().replace(hour=end_hour))
+    
+    def _hours(self, start_hour: Optional[int], end_hour: Optional[int]) -> Tuple[int, int]:
+        """Fill unset business hours from the service configuration."""
+        return (self.start_hour if start_hour is None else start_hour,
+                self.end_hour if end_hour is None else end_hour)
+    
+    def is_working_time(self, dt: datetime) -> bool:
+        """True if dt falls on a working day within business hours."""
+        return dt.weekday() in self.working_days and self.start_hour <= dt.hour < self.end_hour
+    
+    def _day_bounds(self, date: datetime, start_hour: int,
+                    end_hour: int) -> Tuple[datetime, datetime]:
+        """Return the localized start and end of the working day for date."""
+        tz = self.timezone
+        return (datetime(date.year, date.month, date.day, start_hour, tzinfo=tz),
+                datetime(date.year, date.month, date.day, end_hour, tzinfo=tz))
+    
+    def localize(self, dt: datetime) -> datetime:
+        """Attach the service timezone to a naive datetime."""
+        return dt.replace(tzinfo=self.timezone)
+    
+    def _available_slots_from_events(self, events: List[Dict[str, Any]],
+                                     start_of_day: datetime, end_of_day: datetime,
+                                     duration_minutes: int = 30) -> List[datetime]:
+        """
+        Compute free slots between start_of_day and end_of_day from already
+        fetched events or freebusy intervals.
+        
+        Args:
+            events: Events (or `_get_busy` intervals) overlapping the day
+            start_of_day: First slot start
+            end_of_day: End of the working day
+            duration_minutes: Duration of each appointment slot
+        
+        Returns:
+            List of available datetime slots
+        """
+        return self._free_slots(
+            self._busy_intervals(events), start_of_day, end_of_day, duration_minutes
         )
+    
+    def _busy_intervals(self, events: List[Dict[str, Any]]) -> List[Tuple[float, float]]:
+        """
+        Parse events once into merged (start, end) epoch-second pairs.
         
-        existing_events = self.get_events(start_of_day, end_of_day)
+        Overlapping events are merged, so both starts and ends come out sorted.
+        """
+        busy = sorted(
+            (self._parse_datetime(e['start']).timestamp(),
+             self._parse_datetime(e['end']).timestamp())
+            for e in events
+        )
         
-        # Generate all possible slots
-        slots = []
-        current = start_of_day
-        while current < end_of_day:
-            slots.append(current)
-            current += timedelta(minutes=duration_minutes)
+        merged = []
+        for start, end in busy:
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        
+        return merged
+    
+    def _free_slots(self, busy: List[Tuple[float, float]], start_of_day: datetime,
+                    end_of_day: datetime, duration_minutes: int = 30) -> List[datetime]:
+        """
+        Compute free slots for one day from merged busy intervals.
+        
+        Args:
+            busy: Merged (start, end) epoch-second pairs, see `_busy_intervals`
+            start_of_day: First slot start
+            end_of_day: End of the working day
+            duration_minutes: Duration of each appointment slot
         
-        # Filter out occupied slots
+        Returns:
+            List of available datetime slots
+        """
+        step = duration_minutes * 60
+        slot_delta = timedelta(minutes=duration_minutes)
+        day_start = start_of_day.timestamp()
+        # Slots sit on the grid start_of_day + k * step and must start before end_of_day
+        slot_count = max(0, math.ceil((end_of_day.timestamp() - day_start) / step))
+        
+        # Emit grid slots from the gaps between busy intervals (half-open
+        # intervals); fully booked stretches cost nothing
         available_slots = []
-        for slot in slots:
-            slot_end = slot + timedelta(minutes=duration_minutes)
-            is_available = True
-            
-            for event in existing_events:
-                event_start = self._parse_datetime(event['start'])
-                event_end = self._parse_datetime(event['end'])
-                
-                # Check for overlap
-                if not (slot_end <= event_start or slot >= event_end):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append(slot)
+        k = 0
+        for busy_start, busy_end in busy:
+            if k >= slot_count:
+                break
+            # Slots that end by the time this interval starts
+            last = min(slot_count, math.floor((busy_start - day_start) / step))
+            available_slots.extend(
+                start_of_day + slot_delta * i for i in range(k, last)
+            )
+            # Resume at the first slot starting once this interval is over
+            k = max(k, math.ceil((busy_end - day_start) / step))
+        
+        available_slots.extend(
+            start_of_day + slot_delta * i for i in range(k, slot_count)
+        )
         
         return available_slots
     
+    def day_snapshot(self, appointment_time: datetime, duration_minutes: int = 30,
+                     start_hour: Optional[int] = None, end_hour: Optional[int] = None,
+                     max_days_ahead: int = 30, fresh: bool = False) -> Dict[str, Any]:
+        """
+        Answer check_conflict, get_available_slots and suggest_next_available
+        for one proposed time from a single freebusy query covering the
+        whole lookahead.
+        
+        Args:
+            appointment_time: Proposed appointment time
+            duration_minutes: Duration of the appointment
+            start_hour: Start hour (24-hour format), defaults to self.start_hour
+            end_hour: End hour (24-hour format), defaults to self.end_hour
+            max_days_ahead: Maximum days to look ahead for the next free slot
+            fresh: Query the calendar even if a recent result is cached (use
+                right before booking, as other clients may have changed it)
+        
+        Returns:
+            Dict with 'busy' (the fetched intervals), 'conflict' (bool), 'slots'
+            (free slots that day) and 'next_available' (datetime or None)
+        """
+        start_hour, end_hour = self._hours(start_hour, end_hour)
+        if appointment_time.tzinfo is None:
+            appointment_time = self.localize(appointment_time)
+        
+        end_time = appointment_time + timedelta(minutes=duration_minutes)
+        start_of_day, end_of_day = self._day_bounds(appointment_time, start_hour, end_hour)
+        
+        # One window covering the proposed slot and the whole lookahead, so a
+        # fully booked day needs no second round-trip
+        end_date = appointment_time + timedelta(days=max_days_ahead)
+        _, range_end = self._day_bounds(end_date, start_hour, end_hour)
+        busy = self._get_busy(min(start_of_day, appointment_time), max(range_end, end_time), fresh)
+        
+        # Parse once; the conflict check and the slot filters share the intervals
+        intervals = self._busy_intervals(busy)
+        slot_start = appointment_time.timestamp()
+        slot_end = end_time.timestamp()
+        conflict = any(start < slot_end and end > slot_start for start, end in intervals)
+        
+        busy_starts = [start for start, _ in intervals]
+        busy_ends = [end for _, end in intervals]
+        slots = []
+        if appointment_time.weekday() in self.working_days:
+            slots = self._free_slots(
+                self._slice_day(intervals, busy_starts, busy_ends, start_of_day, end_of_day),
+                start_of_day, end_of_day, duration_minutes
+            )
+        
+        # First free slot on or after the proposed time, else look at later days
+        next_available = None
+        for slot in slots:
+            if slot >= appointment_time:
+                next_available = slot
+                break
+        
+        if next_available is None and max_days_ahead > 0:
+            next_day = (appointment_time + _ONE_DAY).replace(
+                hour=start_hour, minute=0, second=0, microsecond=0
+            )
+            next_available = self._first_free_slot(
+                intervals, next_day, end_date, duration_minutes, start_hour, end_hour
+            )
+        
+        return {
+            'busy': busy,
+            'conflict': conflict,
+            'slots': slots,
+            'next_available': next_available,
+        }
+    
     def get_events(self, time_min: datetime, time_max: datetime) -> List[Dict[str, Any]]:
         """
         Get events from calendar within a time range.
@@ -198,23 +560,166 @@ class CalendarService:
         Returns:
             List of event dictionaries
         """
+        key = ('events', time_min, time_max)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        
+        self._ensure_fresh_credentials()
         try:
-            time_min_str = time_min.isoformat()
-            time_max_str = time_max.isoformat()
+            events = self.service.events()
+            list_request = self._events_list_request(time_min, time_max)
+            items = []
+            while list_request is not None:
+                events_result = self._execute(list_request)
+                items.extend(events_result.get('items', []))
+                list_request = events.list_next(list_request, events_result)
             
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=time_min_str,
-                timeMax=time_max_str,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            self._cache_put(key, items)
+            return items
+        except HttpError as error:
+            logger.error("An error occurred: %s", error)
+            return []
+    
+    def _events_list_request(self, time_min: datetime, time_max: datetime):
+        """Build (but don't execute) an events().list request for a time range."""
+        return self.service.events().list(
+            calendarId=self.calendar_id,
+            timeMin=time_min.isoformat(),
+            timeMax=time_max.isoformat(),
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=_EVENTS_PAGE_SIZE,
+            fields=_EVENT_FIELDS
+        )
+    
+    def get_events_batch(self, ranges: List[Tuple[datetime, datetime]]) -> List[List[Dict[str, Any]]]:
+        """
+        Get events for several time ranges in one batched HTTP request.
+        
+        Args:
+            ranges: List of (time_min, time_max) tuples
+        
+        Returns:
+            One event list per range, in the same order (empty on error)
+        """
+        responses = self._execute_batch(
+            [self._events_list_request(time_min, time_max) for time_min, time_max in ranges]
+        )
+        return [response.get('items', []) if response else [] for response in responses]
+    
+    def batch_get_events(self, event_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetch several events by ID in one batched HTTP request.
+        
+        Args:
+            event_ids: Google Calendar event IDs
+        
+        Returns:
+            One event dictionary per ID, in the same order (None if not found)
+        """
+        events = self.service.events()
+        return self._execute_batch([
+            events.get(calendarId=self.calendar_id, eventId=event_id, fields=_EVENT_ITEM_FIELDS)
+            for event_id in event_ids
+        ])
+    
+    def _execute_batch(self, requests: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Send requests as BatchHttpRequests of up to _BATCH_LIMIT parts each.
+        
+        Returns:
+            One response per request, in the same order (None for failed parts)
+        """
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        
+        def collect(request_id, response, exception):
+            if exception is not None:
+                logger.error("An error occurred: %s", exception)
+                results[request_id] = None
+            else:
+                results[request_id] = response
+        
+        self._ensure_fresh_credentials()
+        for chunk_start in range(0, len(requests), _BATCH_LIMIT):
+            batch = self.service.new_batch_http_request(callback=collect)
+            for i, api_request in enumerate(requests[chunk_start:chunk_start + _BATCH_LIMIT]):
+                batch.add(api_request, request_id=str(chunk_start + i))
+            try:
+                self._execute(batch)
+            except HttpError as error:
+                logger.error("An error occurred: %s", error)
+        
+        return [results.get(str(i)) for i in range(len(requests))]
+    
+    def _get_busy(self, time_min: datetime, time_max: datetime,
+                  fresh: bool = False) -> List[Dict[str, str]]:
+        """
+        Get busy intervals from the freebusy API.
+        
+        Cheaper than `get_events` when only start/end matter: no event
+        bodies are returned.
+        
+        Args:
+            time_min: Start time
+            time_max: End time
+            fresh: Skip the cache and always query (the result is still cached)
+        
+        Returns:
+            List of {'start', 'end'} ISO timestamp dictionaries, sorted
+        """
+        key = ('busy', time_min, time_max)
+        if not fresh:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+        
+        self._ensure_fresh_credentials()
+        try:
+            freebusy_result = self._execute(self.service.freebusy().query(body={
+                'timeMin': time_min.isoformat(),
+                'timeMax': time_max.isoformat(),
+                'items': [{'id': self.calendar_id}],
+            }))
             
-            return events_result.get('items', [])
+            calendar = freebusy_result.get('calendars', {}).get(self.calendar_id, {})
+            if calendar.get('errors'):
+                logger.error("An error occurred: %s", calendar['errors'])
+                return []
+            busy = calendar.get('busy', [])
+            self._cache_put(key, busy)
+            return busy
         except HttpError as error:
-            print(f"An error occurred: {error}")
+            logger.error("An error occurred: %s", error)
             return []
     
+    def _cache_get(self, key: tuple) -> Optional[list]:
+        """Return a cached query result younger than _EVENTS_CACHE_TTL."""
+        with self._events_cache_lock:
+            entry = self._events_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < _EVENTS_CACHE_TTL:
+            return entry[3]
+        return None
+    
+    def _cache_put(self, key: tuple, result: list):
+        """Store a query result; key is (kind, time_min, time_max)."""
+        now = time.monotonic()
+        with self._events_cache_lock:
+            if len(self._events_cache) >= _EVENTS_CACHE_MAX_ENTRIES:
+                for stale in [k for k, v in self._events_cache.items()
+                              if now - v[0] >= _EVENTS_CACHE_TTL]:
+                    del self._events_cache[stale]
+                if len(self._events_cache) >= _EVENTS_CACHE_MAX_ENTRIES:
+                    self._events_cache.clear()
+            self._events_cache[key] = (now, key[1], key[2], result)
+    
+    def _invalidate_cache(self, start: datetime, end: datetime):
+        """Drop cached results whose range overlaps [start, end)."""
+        with self._events_cache_lock:
+            for key in [k for k, v in self._events_cache.items()
+                        if v[1] < end and v[2] > start]:
+                del self._events_cache[key]
+    
     def create_appointment(self, patient_name: str, appointment_time: datetime,
                           duration_minutes: int = 30, doctor_name: str = "Dr. Smith",
                           doctor_email: str = None, notes: str = None) -> Dict[str, Any]:
@@ -234,44 +739,45 @@ class CalendarService:
         """
         # Ensure appointment_time is timezone-aware
         if appointment_time.tzinfo is None:
-            appointment_time = self.timezone.localize(appointment_time)
+            appointment_time = self.localize(appointment_time)
         
         end_time = appointment_time + timedelta(minutes=duration_minutes)
         
+        description = f'Patient: {patient_name}\nDoctor: {doctor_name}'
+        if notes:
+            description = f'{description}\nNotes: {notes}'
+        
+        template = self._event_template
         event = {
             'summary': f'Appointment: {patient_name}',
-            'description': f'Patient: {patient_name}\nDoctor: {doctor_name}',
-            'start': {
-                'dateTime': appointment_time.isoformat(),
-                'timeZone': str(self.timezone),
-            },
-            'end': {
-                'dateTime': end_time.isoformat(),
-                'timeZone': str(self.timezone),
-            },
+            'description': description,
+            'start': {**template['start'], 'dateTime': appointment_time.isoformat()},
+            'end': {**template['end'], 'dateTime': end_time.isoformat()},
         }
         
-        if notes:
-            event['description'] += f'\nNotes: {notes}'
-        
         if doctor_email:
             event['attendees'] = [
                 {'email': doctor_email}
             ]
         
+        self._ensure_fresh_credentials()
         try:
-            print(f"Creating appointment in calendar: {self.calendar_id}")
-            print(f"Event details: {patient_name} at {appointment_time}")
+            logger.info("Creating appointment in calendar: %s", self.calendar_id)
+            logger.info("Event details: %s at %s", patient_name, appointment_time)
             
-            created_event = self.service.events().insert(
+            # Not retried: a retry after a lost response would book twice
+            created_event = self._execute(self.service.events().insert(
                 calendarId=self.calendar_id,
                 body=event
-            ).execute()
+            ), num_retries=0)
+            
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("✅ Event created successfully!")
+                logger.info("   Event ID: %s", created_event.get('id'))
+                logger.info("   Event Link: %s", created_event.get('htmlLink', 'N/A'))
+                logger.info("   Calendar: %s", self.calendar_id)
             
-            print(f"✅ Event created successfully!")
-            print(f"   Event ID: {created_event.get('id')}")
-            print(f"   Event Link: {created_event.get('htmlLink', 'N/A')}")
-            print(f"   Calendar: {self.calendar_id}")
+            self._invalidate_cache(appointment_time, end_time)
             
             return created_event
         except HttpError as error:
@@ -297,6 +803,9 @@ class CalendarService:
         """
         Check if an appointment time conflicts with existing events.
         
+        Times outside business hours or working days count as a conflict
+        and are rejected without an API call.
+        
         Args:
             appointment_time: Proposed appointment time
             duration_minutes: Duration of the appointment
@@ -305,28 +814,34 @@ class CalendarService:
             True if there's a conflict, False otherwise
         """
         if appointment_time.tzinfo is None:
-            appointment_time = self.timezone.localize(appointment_time)
+            appointment_time = self.localize(appointment_time)
+        
+        if not self.is_working_time(appointment_time):
+            return True
         
         end_time = appointment_time + timedelta(minutes=duration_minutes)
-        events = self.get_events(appointment_time, end_time)
         
-        return len(events) > 0
+        return bool(self._get_busy(appointment_time, end_time))
     
-    def _parse_datetime(self, dt_dict: Dict[str, str]) -> datetime:
-        """Parse datetime from Google Calendar event format."""
-        if 'dateTime' in dt_dict:
-            dt = datetime.fromisoformat(dt_dict['dateTime'].replace('Z', '+00:00'))
+    def _parse_datetime(self, dt_dict: Union[Dict[str, str], str]) -> datetime:
+        """Parse datetime from Google Calendar event format or a freebusy timestamp."""
+        if isinstance(dt_dict, str):
+            dt = _parse_iso(dt_dict)
+        elif 'dateTime' in dt_dict:
+            dt = _parse_iso(dt_dict['dateTime'])
         else:
             dt = datetime.fromisoformat(dt_dict['date'] + 'T00:00:00')
         
         if dt.tzinfo is None:
-            dt = self.timezone.localize(dt)
+            dt = self.localize(dt)
         
         return dt
     
     def suggest_next_available(self, preferred_date: datetime, 
                               duration_minutes: int = 30,
-                              max_days_ahead: int = 30) -> Optional[datetime]:
+                              max_days_ahead: int = 30,
+                              start_hour: Optional[int] = None,
+                              end_hour: Optional[int] = None) -> Optional[datetime]:
         """
         Suggest the next available appointment slot.
         
@@ -334,28 +849,112 @@ class CalendarService:
             preferred_date: Preferred date/time
             duration_minutes: Duration of appointment
             max_days_ahead: Maximum days to look ahead
+            start_hour: Start hour (24-hour format), defaults to self.start_hour
+            end_hour: End hour (24-hour format), defaults to self.end_hour
         
         Returns:
             Next available datetime or None if none found
         """
+        start_hour, end_hour = self._hours(start_hour, end_hour)
+        if preferred_date.tzinfo is None:
+            preferred_date = self.localize(preferred_date)
+        
+        end_date = preferred_date + timedelta(days=max_days_ahead)
+        
+        # One query for the whole lookahead, sliced per day below
+        range_start, _ = self._day_bounds(preferred_date, start_hour, end_hour)
+        _, range_end = self._day_bounds(end_date, start_hour, end_hour)
+        busy = self._busy_intervals(self._get_busy(range_start, range_end))
+        
+        return self._first_free_slot(
+            busy, preferred_date, end_date, duration_minutes, start_hour, end_hour
+        )
+    
+    def _first_free_slot(self, busy: List[Tuple[float, float]], preferred_date: datetime,
+                         end_date: datetime, duration_minutes: int,
+                         start_hour: int, end_hour: int) -> Optional[datetime]:
+        """
+        Find the first free slot on or after preferred_date, up to end_date,
+        from merged busy intervals already fetched for that range.
+        """
+        busy_starts = [start for start, _ in busy]
+        busy_ends = [end for _, end in busy]
         current_date = preferred_date
-        end_date = current_date + timedelta(days=max_days_ahead)
         
         while current_date <= end_date:
-            slots = self.get_available_slots(current_date, duration_minutes)
-            if slots:
+            if current_date.weekday() in self.working_days:
+                start_of_day, end_of_day = self._day_bounds(current_date, start_hour, end_hour)
+                day_busy = self._slice_day(busy, busy_starts, busy_ends, start_of_day, end_of_day)
+                slots = self._free_slots(day_busy, start_of_day, end_of_day, duration_minutes)
                 # Return the first available slot on or after preferred time
                 for slot in slots:
                     if slot >= preferred_date:
                         return slot
-                # If no slot after preferred time, return first slot of next day
-                if current_date < end_date:
-                    current_date = current_date + timedelta(days=1)
-                    current_date = current_date.replace(hour=9, minute=0, second=0, microsecond=0)
-                    continue
-            current_date = current_date + timedelta(days=1)
-            current_date = current_date.replace(hour=9, minute=0, second=0, microsecond=0)
+            current_date = (current_date + _ONE_DAY).replace(
+                hour=start_hour, minute=0, second=0, microsecond=0
+            )
         
         return None
-
-
+    
+    @staticmethod
+    def _slice_day(busy: List[Tuple[float, float]], busy_starts: List[float],
+                   busy_ends: List[float], start_of_day: datetime,
+                   end_of_day: datetime) -> List[Tuple[float, float]]:
+        """Return the merged busy intervals that overlap one working day."""
+        lo = bisect.bisect_right(busy_ends, start_of_day.timestamp())
+        hi = bisect.bisect_left(busy_starts, end_of_day.timestamp())
+        return busy[lo:hi]
+    
+    async def _run_in_executor(self, func, *args, **kwargs):
+        """Run a blocking API wrapper in the default executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    
+    async def prefetch_today(self):
+        """
+        Warm the OAuth token and a pooled HTTPS connection in the background,
+        so the first real availability check skips the token refresh and the
+        TLS handshake.
+        
+        The freebusy result this caches is not reused: it expires after
+        `_EVENTS_CACHE_TTL`, well before the patient has given a name,
+        symptoms and a proposed time.
+        """
+        start_of_day, _ = self._day_bounds(datetime.now(self.timezone), *self._hours(None, None))
+        try:
+            await self._run_in_executor(self.day_snapshot, start_of_day)
+        except Exception as e:
+            logger.warning("Warning: Could not prefetch today's availability: %s", e)
+    
+    async def get_events_async(self, time_min: datetime, time_max: datetime) -> List[Dict[str, Any]]:
+        """Async version of `get_events`."""
+        return await self._run_in_executor(self.get_events, time_min, time_max)
+    
+    async def get_events_many_async(self, ranges: List[Tuple[datetime, datetime]]) -> List[List[Dict[str, Any]]]:
+        """
+        Fetch events for several time ranges concurrently.
+        
+        Args:
+            ranges: List of (time_min, time_max) tuples
+        
+        Returns:
+            One event list per range, in the same order
+        """
+        return list(await asyncio.gather(
+            *(self.get_events_async(time_min, time_max) for time_min, time_max in ranges)
+        ))
+    
+    async def check_conflict_async(self, appointment_time: datetime, duration_minutes: int = 30) -> bool:
+        """Async version of `check_conflict`."""
+        return await self._run_in_executor(self.check_conflict, appointment_time, duration_minutes)
+    
+    async def day_snapshot_async(self, appointment_time: datetime, **kwargs) -> Dict[str, Any]:
+        """Async version of `day_snapshot`."""
+        return await self._run_in_executor(self.day_snapshot, appointment_time, **kwargs)
+    
+    async def create_appointment_async(self, patient_name: str, appointment_time: datetime,
+                                       **kwargs) -> Dict[str, Any]:
+        """Async version of `create_appointment`."""
+        return await self._run_in_executor(
+            self.create_appointment, patient_name, appointment_time, **kwargs
+        )
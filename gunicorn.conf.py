@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for the Python ML service.
+
+Run with:
+    gunicorn -c gunicorn.conf.py 'ml_service:create_app()'
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('ML_SERVICE_PORT', '5001')}"
+
+# Threaded worker: each request gets a real OS thread, so a request blocked
+# on Gemini (grpc, which gevent can't make cooperative) or Google Calendar
+# doesn't hold up the others
+worker_class = "gthread"
+threads = 16
+
+# The conversation state (single agent, calendar cache) lives in-process, so
+# every request must reach the same worker
+workers = 1
+
+# Gemini replies can take a while; keep the backend's connections open
+timeout = 120
+keepalive = 75
@@ -5,6 +5,10 @@ Provides a command-line interface for interacting with the AI agent.
 
 import os
 import sys
+import asyncio
+import functools
+import logging
+import threading
 from dotenv import load_dotenv
 from calendar_service import CalendarService
 from appointment_agent import AppointmentAgent
@@ -23,8 +27,41 @@ def print_welcome():
     print("Type 'quit' or 'exit' to end the conversation.\n")
 
 
-def main():
+async def read_input(prompt: str) -> str:
+    """
+    Read a line without blocking the event loop.
+    
+    Uses a daemon thread so a pending input() never keeps the process
+    alive on exit.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def read():
+        try:
+            line = input(prompt)
+        except BaseException as e:
+            loop.call_soon_threadsafe(future.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(future.set_result, line)
+    
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+
+def stream_reply(agent: AppointmentAgent, user_input: str):
+    """Print the agent's reply as it is generated."""
+    print("\nAgent: ", end="", flush=True)
+    for chunk in agent.chat_stream(user_input):
+        print(chunk, end="", flush=True)
+    print("\n")
+
+
+async def main():
     """Main function to run the appointment booking agent."""
+    # Calendar progress messages go through logging; keep them looking like prints
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     # Check for required environment variables
     if not os.getenv('GEMINI_API_KEY'):
         print("Error: GEMINI_API_KEY not found in environment variables.")
@@ -51,31 +88,40 @@ def main():
         print(f"Error initializing calendar service: {e}")
         sys.exit(1)
     
+    loop = asyncio.get_running_loop()
+    
+    # Warm the calendar token and connection while the agent starts; the
+    # agent is built in the executor so the loop is free to run this meanwhile
+    prefetch = asyncio.create_task(calendar_service.prefetch_today())
+    
     # Initialize appointment agent
     try:
         doctor_name = os.getenv('DOCTOR_NAME', 'Dr. Smith')
         doctor_email = os.getenv('DOCTOR_EMAIL')
-        agent = AppointmentAgent(
+        agent = await loop.run_in_executor(None, functools.partial(
+            AppointmentAgent,
             calendar_service=calendar_service,
             doctor_name=doctor_name,
             doctor_email=doctor_email
-        )
+        ))
         print("✓ AI Agent initialized\n")
     except Exception as e:
         print(f"Error initializing appointment agent: {e}")
         sys.exit(1)
     
+    await prefetch
+    
     # Start conversation
     print_welcome()
     
     # Initial greeting
-    greeting = agent.chat("Hello")
+    greeting = await loop.run_in_executor(None, agent.chat, "Hello")
     print(f"Agent: {greeting}\n")
     
     # Conversation loop
     while True:
         try:
-            user_input = input("You: ").strip()
+            user_input = (await read_input("You: ")).strip()
             
             if not user_input:
                 continue
@@ -89,11 +135,10 @@ def main():
                 print("\nAgent: Conversation reset. How can I help you today?\n")
                 continue
             
-            # Get response from agent
-            response = agent.chat(user_input)
-            print(f"\nAgent: {response}\n")
+            # Stream the response from agent as it is generated
+            await loop.run_in_executor(None, stream_reply, agent, user_input)
             
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n\nAgent: Thank you for using our appointment booking service. Have a great day! 👋\n")
             break
         except Exception as e:
@@ -102,6 +147,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n\nAgent: Thank you for using our appointment booking service. Have a great day! 👋\n")
 
 
@@ -5,24 +5,114 @@ Bridges the Node.js backend with the Python appointment agent and calendar servi
 
 import os
 import sys
-from flask import Flask, request, jsonify
+import time
+import atexit
+import logging
+import logging.handlers
+import queue
+import traceback
+import orjson
+import ciso8601
+from datetime import datetime, timedelta
+from flask import Flask, request
 from flask_cors import CORS
+from flask_compress import Compress
 from dotenv import load_dotenv
 from calendar_service import CalendarService
 from appointment_agent import AppointmentAgent
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+def _start_log_listener():
+    """
+    Route log records through a queue to a background writer thread.
+    
+    Request handlers only enqueue records; the listener thread does the
+    formatting and the (locking, flushing) writes to stderr.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
+
+_start_log_listener()
+
+# Debugger and reloader only on request; they double the process and
+# slow every request down
+DEBUG = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes')
+
 app = Flask(__name__)
+# Compact, unsorted JSON for anything still going through Flask's provider,
+# 500 responses instead of re-raising (except in debug, where the
+# interactive debugger needs them) and no trailing-slash redirects.
+# strict_slashes must be set before the routes below are registered.
+app.json.compact = True
+app.json.sort_keys = False
+if not DEBUG:
+    app.config.update(PROPAGATE_EXCEPTIONS=False)
+app.url_map.strict_slashes = False
 CORS(app)  # Enable CORS for frontend/backend communication
 
+# Brotli/gzip responses worth compressing (mainly /list_events)
+app.config.update(COMPRESS_ALGORITHM=['br', 'gzip'], COMPRESS_MIN_SIZE=512)
+Compress(app)
+
 # Global instances
 calendar_service = None
 appointment_agent = None
 
+# Configuration read once by initialize_services()
+DOCTOR_NAME = 'Dr. Smith'
+DOCTOR_EMAIL = None
+CREDS_PATH = 'credentials.json'
+TOKEN_PATH = None
+
+# (checked_at, credentials file exists, token file exists) for /check_auth,
+# which the frontend polls
+_AUTH_FILES_TTL = 5
+_auth_files = None
+
+# Event fields returned by /list_events
+_EVENT_KEYS = ('id', 'summary', 'start', 'end', 'htmlLink')
+
+# Pre-serialized /health body, rebuilt by initialize_services(), and the
+# last /check_auth state with its body; both are polled far more often than
+# they change
+_health_body = None
+_check_auth_cache = None
+
+def _j(payload, status=200):
+    """Serialize payload with orjson into a JSON response."""
+    return app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_NAIVE_UTC),
+        status=status,
+        mimetype='application/json'
+    )
+
+def _build_health_body():
+    """Serialize the /health payload for the current services."""
+    global _health_body
+    _health_body = orjson.dumps({
+        'status': 'healthy',
+        'calendar_connected': calendar_service is not None,
+        'agent_ready': appointment_agent is not None,
+        'calendar_id': calendar_service.calendar_id if calendar_service else None
+    })
+
 def initialize_services():
     """Initialize calendar service and appointment agent."""
-    global calendar_service, appointment_agent
+    global calendar_service, appointment_agent, DOCTOR_NAME, DOCTOR_EMAIL, CREDS_PATH, TOKEN_PATH
     
     try:
         # Initialize calendar service
@@ -32,64 +122,89 @@ def initialize_services():
             calendar_id=calendar_id,
             timezone=timezone
         )
-        print("✓ Calendar service initialized")
-        print(f"  Calendar ID: {calendar_id}")
-        print(f"  Timezone: {timezone}")
+        logger.info("✓ Calendar service initialized")
+        logger.info("  Calendar ID: %s", calendar_id)
+        logger.info("  Timezone: %s", timezone)
+        
+        CREDS_PATH = calendar_service.credentials_file
+        TOKEN_PATH = calendar_service.token_file
         
         # Initialize appointment agent
-        doctor_name = os.getenv('DOCTOR_NAME', 'Dr. Smith')
-        doctor_email = os.getenv('DOCTOR_EMAIL')
+        DOCTOR_NAME = os.getenv('DOCTOR_NAME', 'Dr. Smith')
+        DOCTOR_EMAIL = os.getenv('DOCTOR_EMAIL')
         appointment_agent = AppointmentAgent(
             calendar_service=calendar_service,
-            doctor_name=doctor_name,
-            doctor_email=doctor_email
+            doctor_name=DOCTOR_NAME,
+            doctor_email=DOCTOR_EMAIL
         )
-        print("✓ Appointment agent initialized")
+        logger.info("✓ Appointment agent initialized")
         
         return True
     except Exception as e:
-        print(f"Error initializing services: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error initializing services: %s", e)
         return False
+    finally:
+        _build_health_body()
+
+def create_app():
+    """
+    Application factory for WSGI servers (see gunicorn.conf.py).
+    
+    Raises:
+        RuntimeError: If the calendar service or agent can't be initialized
+    """
+    if appointment_agent is None and not initialize_services():
+        raise RuntimeError("Failed to initialize services")
+    return app
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({
-        'status': 'healthy',
-        'calendar_connected': calendar_service is not None,
-        'agent_ready': appointment_agent is not None,
-        'calendar_id': calendar_service.calendar_id if calendar_service else None
-    })
+    if _health_body is None:
+        _build_health_body()
+    return app.response_class(_health_body, mimetype='application/json')
+
+def _auth_files_exist():
+    """Return (credentials file exists, token file exists), rechecked every few seconds."""
+    global _auth_files
+    now = time.monotonic()
+    if _auth_files is None or now - _auth_files[0] >= _AUTH_FILES_TTL:
+        _auth_files = (now, os.path.exists(CREDS_PATH), os.path.exists(TOKEN_PATH))
+    return _auth_files[1], _auth_files[2]
 
 @app.route('/check_auth', methods=['GET'])
 def check_auth():
     """Check if Google Calendar authentication is configured."""
+    global _check_auth_cache
     try:
         if calendar_service is None:
-            return jsonify({
+            return _j({
                 'success': False,
                 'authenticated': False,
                 'message': 'Calendar service not initialized'
-            }), 500
+            }, 500)
         
         # Check if credentials file exists
-        creds_exist = os.path.exists('credentials.json')
-        token_exist = os.path.exists('token.pickle')
+        creds_exist, token_exist = _auth_files_exist()
+        state = (creds_exist, token_exist, calendar_service.service is not None)
         
-        return jsonify({
-            'success': True,
-            'authenticated': creds_exist and (token_exist or calendar_service.service is not None),
-            'credentials_file': creds_exist,
-            'token_file': token_exist,
-            'calendar_id': calendar_service.calendar_id
-        })
+        # Only re-serialize when one of the checks has changed
+        cached = _check_auth_cache
+        if cached is None or cached[0] != state:
+            cached = _check_auth_cache = (state, orjson.dumps({
+                'success': True,
+                'authenticated': creds_exist and (state[2] or token_exist),
+                'credentials_file': creds_exist,
+                'token_file': token_exist,
+                'calendar_id': calendar_service.calendar_id
+            }))
+        
+        return app.response_class(cached[1], mimetype='application/json')
     except Exception as e:
-        return jsonify({
+        return _j({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/set_credentials', methods=['POST'])
 def set_credentials():
@@ -97,142 +212,136 @@ def set_credentials():
     try:
         # This endpoint can be used to set credentials dynamically
         # For now, we use the credentials.json file
-        return jsonify({
+        return _j({
             'success': True,
             'message': 'Credentials should be placed in credentials.json file'
         })
     except Exception as e:
-        return jsonify({
+        return _j({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat messages from the frontend."""
     try:
         if appointment_agent is None:
-            print("ERROR: Appointment agent is None")
-            return jsonify({
+            logger.error("ERROR: Appointment agent is None")
+            return _j({
                 'success': False,
                 'error': 'Appointment agent not initialized'
-            }), 500
+            }, 500)
         
-        data = request.json
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            return _j({
+                'success': False,
+                'error': 'Invalid JSON body'
+            }, 400)
         if not data:
-            return jsonify({
+            return _j({
                 'success': False,
                 'error': 'No data received'
-            }), 400
+            }, 400)
         
         # Support both 'input' and 'message' keys
         user_message = data.get('input') or data.get('message', '')
         history = data.get('history', [])
         
-        print(f"Received message: {user_message[:50]}...")
+        logger.info("Received message: %s...", user_message[:50])
         
         if not user_message:
-            return jsonify({
+            return _j({
                 'success': False,
                 'error': 'Message is required'
-            }), 400
+            }, 400)
         
         # Get response from appointment agent
         try:
             response_text = appointment_agent.chat(user_message)
-            print(f"Agent response generated: {len(response_text)} chars")
+            logger.info("Agent response generated: %d chars", len(response_text))
         except Exception as agent_error:
-            print(f"Error in appointment agent: {agent_error}")
+            logger.error("Error in appointment agent: %s", agent_error)
             raise agent_error
         
         # Check if appointment was confirmed
-        should_transition = appointment_agent.extracted_info.get('confirmed', False)
+        info = appointment_agent.extracted_info
+        confirmed = bool(info.get('confirmed'))
         
-        # Get event details if appointment was created
+        # Event details of the booking made by the agent, if any
         event_info = None
-        if should_transition and appointment_agent.extracted_info.get('confirmed'):
-            # Try to get the last created event
-            try:
-                # Get recent events to find the one we just created
-                from datetime import datetime, timedelta
-                now = datetime.now(appointment_agent.calendar_service.timezone)
-                events = appointment_agent.calendar_service.get_events(
-                    now - timedelta(hours=1),
-                    now + timedelta(days=30)
-                )
-                # Find the most recent event for this patient
-                patient_name = appointment_agent.extracted_info.get('patient_name')
-                if patient_name and events:
-                    for event in reversed(events):
-                        if patient_name in event.get('summary', ''):
-                            event_info = {
-                                'id': event.get('id'),
-                                'htmlLink': event.get('htmlLink'),
-                                'summary': event.get('summary'),
-                                'start': event.get('start'),
-                                'end': event.get('end')
-                            }
-                            break
-            except Exception as e:
-                print(f"Could not retrieve event info: {e}")
+        event = appointment_agent.last_event
+        if confirmed and event:
+            event_info = {
+                'id': event.get('id'),
+                'htmlLink': event.get('htmlLink'),
+                'summary': event.get('summary'),
+                'start': event.get('start'),
+                'end': event.get('end')
+            }
         
-        return jsonify({
+        return _j({
             'success': True,
             'response': response_text,
-            'shouldTransition': should_transition,
+            'shouldTransition': confirmed,
             'extracted_info': {
-                'patient_name': appointment_agent.extracted_info.get('patient_name'),
-                'appointment_datetime': str(appointment_agent.extracted_info.get('appointment_datetime')) if appointment_agent.extracted_info.get('appointment_datetime') else None,
-                'confirmed': appointment_agent.extracted_info.get('confirmed', False)
+                'patient_name': info.get('patient_name'),
+                'appointment_datetime': appointment_agent.appointment_datetime_iso(),
+                'confirmed': confirmed
             },
             'event_info': event_info
         })
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error in chat endpoint: {e}")
-        print(f"Traceback: {error_trace}")
-        return jsonify({
+        logger.exception("Error in chat endpoint: %s", e)
+        return _j({
             'success': False,
             'error': str(e),
-            'details': error_trace if app.debug else None
-        }), 500
+            'details': traceback.format_exc() if app.debug else None
+        }, 500)
 
 @app.route('/book_appointment', methods=['POST'])
 def book_appointment():
     """Book an appointment directly."""
     try:
         if calendar_service is None or appointment_agent is None:
-            return jsonify({
+            return _j({
                 'success': False,
                 'error': 'Services not initialized'
-            }), 500
+            }, 500)
+        
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            return _j({
+                'success': False,
+                'error': 'Invalid JSON body'
+            }, 400)
         
-        data = request.json
         patient_name = data.get('patient_name')
         patient_email = data.get('patient_email')
         datetime_iso = data.get('datetime_iso')
         doctor_id = data.get('doctor_id')
         
         if not all([patient_name, datetime_iso]):
-            return jsonify({
+            return _j({
                 'success': False,
                 'error': 'patient_name and datetime_iso are required'
-            }), 400
+            }, 400)
         
-        # Parse datetime
-        from datetime import datetime
-        appointment_time = datetime.fromisoformat(datetime_iso.replace('Z', '+00:00'))
+        # Parse datetime (ciso8601 understands a trailing 'Z' natively)
+        appointment_time = ciso8601.parse_datetime(datetime_iso)
         
         # Create appointment
         event = calendar_service.create_appointment(
             patient_name=patient_name,
             appointment_time=appointment_time,
-            doctor_name=os.getenv('DOCTOR_NAME', 'Dr. Smith'),
-            doctor_email=os.getenv('DOCTOR_EMAIL')
+            doctor_name=DOCTOR_NAME,
+            doctor_email=DOCTOR_EMAIL
         )
         
-        return jsonify({
+        return _j({
             'success': True,
             'booking': {
                 'id': event.get('id'),
@@ -244,51 +353,43 @@ def book_appointment():
             }
         })
     except Exception as e:
-        print(f"Error booking appointment: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception("Error booking appointment: %s", e)
+        return _j({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/list_events', methods=['GET'])
 def list_events():
     """List recent events in the calendar for verification."""
     try:
         if calendar_service is None:
-            return jsonify({
+            return _j({
                 'success': False,
                 'error': 'Calendar service not initialized'
-            }), 500
+            }, 500)
         
-        from datetime import datetime, timedelta
-        now = datetime.now(calendar_service.timezone)
-        start_time = now - timedelta(days=7)
-        end_time = now + timedelta(days=30)
+        # Align the window to the hour so repeated polls ask for the same range
+        # and are served from the calendar service's short-lived query cache
+        # (which booking an appointment invalidates)
+        hour = datetime.now(calendar_service.timezone).replace(minute=0, second=0, microsecond=0)
+        start_time = hour - timedelta(days=7)
+        end_time = hour + timedelta(days=30, hours=1)
         
         events = calendar_service.get_events(start_time, end_time)
         
-        return jsonify({
+        return _j({
             'success': True,
             'calendar_id': calendar_service.calendar_id,
-            'events': [
-                {
-                    'id': e.get('id'),
-                    'summary': e.get('summary'),
-                    'start': e.get('start'),
-                    'end': e.get('end'),
-                    'htmlLink': e.get('htmlLink')
-                }
-                for e in events
-            ],
+            # e.get, not itemgetter: summary/htmlLink may be missing
+            'events': [dict(zip(_EVENT_KEYS, map(e.get, _EVENT_KEYS))) for e in events],
             'count': len(events)
         })
     except Exception as e:
-        return jsonify({
+        return _j({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/reset', methods=['POST'])
 def reset():
@@ -296,35 +397,35 @@ def reset():
     try:
         if appointment_agent:
             appointment_agent.reset()
-        return jsonify({
+        return _j({
             'success': True,
             'message': 'Conversation reset'
         })
     except Exception as e:
-        return jsonify({
+        return _j({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 if __name__ == '__main__':
-    print("=" * 60)
-    print("  Python ML Service - Starting...")
-    print("=" * 60)
+    logger.info("=" * 60)
+    logger.info("  Python ML Service - Starting...")
+    logger.info("=" * 60)
     
     # Initialize services
     if not initialize_services():
-        print("Failed to initialize services. Exiting.")
+        logger.error("Failed to initialize services. Exiting.")
         sys.exit(1)
     
     port = int(os.getenv('ML_SERVICE_PORT', 5001))  # Changed from 5000 to avoid AirPlay conflict
-    print(f"\n✓ ML Service running on http://localhost:{port}")
-    print("  Available endpoints:")
-    print("    GET  /health - Health check")
-    print("    GET  /check_auth - Check authentication")
-    print("    GET  /list_events - List recent calendar events")
-    print("    POST /chat - Chat with AI agent")
-    print("    POST /book_appointment - Book appointment")
-    print("    POST /reset - Reset conversation")
-    print("\n" + "=" * 60 + "\n")
+    logger.info("\n✓ ML Service running on http://localhost:%s", port)
+    logger.info("  Available endpoints:")
+    logger.info("    GET  /health - Health check")
+    logger.info("    GET  /check_auth - Check authentication")
+    logger.info("    GET  /list_events - List recent calendar events")
+    logger.info("    POST /chat - Chat with AI agent")
+    logger.info("    POST /book_appointment - Book appointment")
+    logger.info("    POST /reset - Reset conversation")
+    logger.info("\n" + "=" * 60 + "\n")
     
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port, debug=DEBUG, threaded=True)
@@ -5,6 +5,8 @@ Run this before using the main application to ensure everything is configured co
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -48,6 +50,16 @@ def check_credentials():
         return False
 
 
+def is_installed(package):
+    """Check whether a package can be found, without importing it."""
+    # find_spec only locates the module; importing langchain & co. just
+    # to see if they exist takes seconds
+    try:
+        return find_spec(package) is not None
+    except ModuleNotFoundError:  # Parent package of a dotted name is missing
+        return False
+
+
 def check_dependencies():
     """Check if required Python packages are installed."""
     print("\nChecking Python dependencies...")
@@ -58,22 +70,19 @@ def check_dependencies():
         'google.auth',
         'googleapiclient',
         'dotenv',
-        'pytz',
         'google.generativeai'
     ]
     
     all_installed = True
     
-    for package in required_packages:
-        try:
-            if package == 'google.auth':
-                __import__('google.auth')
-            elif package == 'googleapiclient':
-                __import__('googleapiclient')
-            else:
-                __import__(package.replace('-', '_'))
+    # The lookups are filesystem-bound, so probe all packages at once
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(is_installed, required_packages))
+    
+    for package, installed in zip(required_packages, results):
+        if installed:
             print(f"  ✓ {package} is installed")
-        except ImportError:
+        else:
             print(f"  ✗ {package} is NOT installed")
             all_installed = False
     
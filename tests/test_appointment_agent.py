@@ -0,0 +1,192 @@
+"""
+Tests for the appointment agent's date/time extraction.
+Run with: python -m pytest tests
+"""
+
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from zoneinfo import ZoneInfo
+
+from appointment_agent import AppointmentAgent
+
+
+TIMEZONE = ZoneInfo('America/New_York')
+
+
+class FakeCalendarService:
+    """The parts of CalendarService that date parsing uses."""
+
+    timezone = TIMEZONE
+    calendar_id = 'primary'
+
+    def localize(self, dt):
+        return dt.replace(tzinfo=self.timezone)
+
+
+def make_agent(stage='datetime'):
+    """Build an agent without the LLM; parsing doesn't need it."""
+    agent = AppointmentAgent.__new__(AppointmentAgent)
+    agent.calendar_service = FakeCalendarService()
+    agent._today_context = None
+    agent.conversation_stage = stage
+    agent.extracted_info = {
+        'patient_name': 'John Smith',
+        'symptoms': 'headache for three days',
+        'preferred_date': None,
+        'preferred_time': None,
+        'appointment_datetime': None,
+        'doctor_assigned': True,
+        'confirmed': False
+    }
+    return agent
+
+
+def ordinal(day):
+    """1 -> '1st', 15 -> '15th'."""
+    if 10 <= day % 100 <= 20:
+        return f"{day}th"
+    suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
+    return f"{day}{suffix}"
+
+
+class TestParseDatetime(unittest.TestCase):
+    """Patterns and the ISO fast path, which don't need dateparser."""
+
+    def setUp(self):
+        self.agent = make_agent()
+
+    def test_iso_date_only_defaults_to_9am(self):
+        dt = self.agent._parse_datetime('2030-01-15')
+        self.assertEqual(dt, datetime(2030, 1, 15, 9, 0, tzinfo=TIMEZONE))
+
+    def test_iso_datetime_keeps_time(self):
+        dt = self.agent._parse_datetime('2030-01-15T14:30')
+        self.assertEqual(dt, datetime(2030, 1, 15, 14, 30, tzinfo=TIMEZONE))
+
+    def test_keyword_and_time(self):
+        dt = self.agent._parse_datetime('tomorrow at 3pm')
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        self.assertEqual((dt.date(), dt.hour, dt.minute), (tomorrow, 15, 0))
+
+    def test_out_of_range_time_is_not_an_error(self):
+        # Used to raise "hour must be in 0..23" and fail the /chat request;
+        # without dateparser these fall back to None
+        for message in ('friday 13pm', 'monday 24:00', 'monday 10:75'):
+            dt = self.agent._parse_datetime(message)
+            if dt is not None:
+                self.assertTrue(0 <= dt.hour <= 23 and 0 <= dt.minute <= 59, message)
+
+    def test_dotted_minutes(self):
+        dt = self.agent._parse_datetime('tomorrow 10.30am')
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        self.assertEqual((dt.date(), dt.hour, dt.minute), (tomorrow, 10, 30))
+
+    def test_weekday_abbreviations(self):
+        today = datetime.now().date()
+        for message, weekday, hour in (('thurs 10am', 3, 10), ('thur at 11am', 3, 11),
+                                       ('weds at 2pm', 2, 14), ('tues 9am', 1, 9),
+                                       ('thursday 3pm', 3, 15), ('tuesday 4pm', 1, 16)):
+            dt = self.agent._parse_datetime(message)
+            self.assertIsNotNone(dt, message)
+            self.assertEqual((dt.weekday(), dt.hour), (weekday, hour), message)
+            self.assertTrue(0 < (dt.date() - today).days <= 7, message)
+
+
+@unittest.skipUnless(find_spec('dateparser'), "dateparser is not installed")
+class TestParseWithDateparser(unittest.TestCase):
+    """Phrasings that fall through to dateparser."""
+
+    def setUp(self):
+        self.agent = make_agent()
+
+    def assertNotParsed(self, message):
+        self.assertIsNone(self.agent._parse_datetime(message), message)
+
+    def test_non_dates_are_rejected(self):
+        # "ok" used to be read as Yoruba and "no" as today 9 AM
+        for message in ('ok', 'no', 'okay', 'sure', 'may I book'):
+            self.assertNotParsed(message)
+
+    def test_bare_number_is_rejected(self):
+        # Used to come back as October next year
+        self.assertNotParsed('10')
+
+    def test_bare_hour_is_an_afternoon_time(self):
+        # Used to come back as February next year
+        dt = self.agent._parse_datetime('at 2')
+        now = datetime.now(TIMEZONE)
+        self.assertEqual((dt.hour, dt.minute), (14, 0))
+        self.assertTrue(now <= dt <= now + timedelta(days=1))
+
+    def test_relative_time_keeps_its_time(self):
+        # Used to be clamped to 9 AM today
+        dt = self.agent._parse_datetime('in 2 hours')
+        expected = datetime.now(TIMEZONE) + timedelta(hours=2)
+        self.assertLess(abs(dt - expected), timedelta(minutes=2))
+
+    def test_ordinal_day_with_bare_hour(self):
+        day = (datetime.now(TIMEZONE) + timedelta(days=3)).day
+        dt = self.agent._parse_datetime(f'the {ordinal(day)} at 2')
+        self.assertEqual((dt.day, dt.hour, dt.minute), (day, 14, 0))
+
+    def test_ordinal_day_defaults_to_9am(self):
+        day = (datetime.now(TIMEZONE) + timedelta(days=3)).day
+        dt = self.agent._parse_datetime(f'the {ordinal(day)}')
+        self.assertEqual((dt.day, dt.hour, dt.minute), (day, 9, 0))
+
+    def test_beyond_lookahead_is_rejected(self):
+        far = datetime.now(TIMEZONE) + timedelta(days=90)
+        self.assertNotParsed(f"{far.strftime('%B')} {far.day} at 10am")
+
+    def test_ok_in_datetime_stage_sets_nothing(self):
+        # A bare "ok" must not set a datetime that the same turn then books
+        self.agent._update_extracted_info('ok', 'ok')
+        self.assertIsNone(self.agent.extracted_info['appointment_datetime'])
+        self.assertEqual(self.agent.conversation_stage, 'datetime')
+
+
+class FixedDatetime(datetime):
+    """datetime whose now() returns `current`."""
+
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+class TestCacheKey(unittest.TestCase):
+    """The response cache key follows the date and hour, not the clock header."""
+
+    def test_now_header_is_ignored(self):
+        agent = make_agent(stage='greeting')
+
+        def messages(now):
+            return [SimpleNamespace(type='system', content='prompt'),
+                    SimpleNamespace(type='human', content=f"[Now: {now}]\nHello")]
+
+        with mock.patch('appointment_agent.datetime', FixedDatetime):
+            FixedDatetime.current = datetime(2030, 1, 14, 9, 0)
+            first = agent._cache_key(messages('Monday at 09:00 AM'))
+            FixedDatetime.current = datetime(2030, 1, 14, 9, 1)
+            second = agent._cache_key(messages('Monday at 09:01 AM'))
+        self.assertEqual(first, second)
+
+    def test_different_date_misses(self):
+        agent = make_agent(stage='greeting')
+        messages = [SimpleNamespace(type='system', content='prompt'),
+                    SimpleNamespace(type='human', content="[Now: now]\nHello")]
+
+        with mock.patch('appointment_agent.datetime', FixedDatetime):
+            FixedDatetime.current = datetime(2030, 1, 14, 9, 0)
+            monday = agent._cache_key(messages)
+            FixedDatetime.current = datetime(2030, 1, 15, 9, 0)
+            tuesday = agent._cache_key(messages)
+        self.assertNotEqual(monday, tuesday)
+
+
+if __name__ == '__main__':
+    unittest.main()
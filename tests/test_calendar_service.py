@@ -0,0 +1,135 @@
+"""
+Tests for CalendarService's slot computation.
+Run with: python -m pytest tests
+
+The gap walk in `_free_slots`, the bisect slicing in `_slice_day` and the
+single-query `day_snapshot` are compared with the original generate-then-
+filter loop on randomized calendars.
+"""
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from calendar_service import CalendarService
+
+
+TIMEZONE = ZoneInfo('America/New_York')
+CASES = 3000
+
+
+def make_service(busy, start_hour=9, end_hour=17, working_days=None):
+    """CalendarService without Google; freebusy answers come from `busy`."""
+    service = CalendarService.__new__(CalendarService)
+    service.timezone = TIMEZONE
+    service.calendar_id = 'primary'
+    service.start_hour = start_hour
+    service.end_hour = end_hour
+    service.working_days = frozenset(range(7) if working_days is None else working_days)
+
+    def get_busy(time_min, time_max, fresh=False):
+        return [{'start': start.isoformat(), 'end': end.isoformat()}
+                for start, end in busy if start < time_max and end > time_min]
+
+    service._get_busy = get_busy
+    return service
+
+
+def reference_slots(busy, date, duration, start_hour, end_hour, working_days):
+    """The original loop: every grid slot that overlaps no busy interval."""
+    if date.weekday() not in working_days:
+        return []
+    start_of_day = datetime(date.year, date.month, date.day, start_hour, tzinfo=TIMEZONE)
+    end_of_day = datetime(date.year, date.month, date.day, end_hour, tzinfo=TIMEZONE)
+    step = timedelta(minutes=duration)
+
+    slots = []
+    current = start_of_day
+    while current < end_of_day:
+        slot_end = current + step
+        if all(slot_end <= start or current >= end for start, end in busy):
+            slots.append(current)
+        current += step
+    return slots
+
+
+def reference_next_available(busy, preferred, duration, start_hour, end_hour,
+                             working_days, max_days_ahead):
+    """The original suggest_next_available loop."""
+    current = preferred
+    end_date = preferred + timedelta(days=max_days_ahead)
+    while current <= end_date:
+        for slot in reference_slots(busy, current, duration, start_hour, end_hour, working_days):
+            if slot >= preferred:
+                return slot
+        current = (current + timedelta(days=1)).replace(hour=start_hour, minute=0,
+                                                        second=0, microsecond=0)
+    return None
+
+
+def random_calendar(rng, first_day, days):
+    """Random, possibly overlapping busy intervals, some outside business hours."""
+    busy = []
+    for _ in range(rng.randint(0, 12 * days)):
+        day = first_day + timedelta(days=rng.randrange(days))
+        start = datetime(day.year, day.month, day.day, tzinfo=TIMEZONE) + timedelta(
+            minutes=rng.randrange(6 * 60, 20 * 60, rng.choice((1, 5, 15))))
+        end = start + timedelta(minutes=rng.choice((5, 15, 30, 45, 60, 90, 240, 1500)))
+        busy.append((start, end))
+    busy.sort()
+    return busy
+
+
+class TestSlotsAgainstReference(unittest.TestCase):
+    """Randomized comparison with the generate-then-filter implementation."""
+
+    def test_random_calendars(self):
+        rng = random.Random(20240115)
+        for case in range(CASES):
+            first_day = datetime(2030, 1, 1) + timedelta(days=rng.randrange(365))
+            lookahead = rng.choice((0, 1, 3, 7))
+            busy = random_calendar(rng, first_day, lookahead + 2)
+            start_hour = rng.choice((7, 8, 9))
+            end_hour = rng.choice((12, 16, 17, 18))
+            working_days = frozenset(d for d in range(7) if rng.random() < 0.8)
+            duration = rng.choice((15, 30, 60))
+            service = make_service(busy, start_hour, end_hour, working_days)
+
+            preferred = datetime(first_day.year, first_day.month, first_day.day,
+                                 tzinfo=TIMEZONE) + timedelta(
+                minutes=rng.randrange(start_hour * 60, end_hour * 60, 15))
+            expected_slots = reference_slots(busy, preferred, duration, start_hour,
+                                             end_hour, working_days)
+            expected_next = reference_next_available(busy, preferred, duration, start_hour,
+                                                     end_hour, working_days, lookahead)
+            slot_end = preferred + timedelta(minutes=duration)
+            expected_conflict = any(start < slot_end and end > preferred for start, end in busy)
+
+            context = f"case {case}: {preferred} for {duration} min"
+            self.assertEqual(service.get_available_slots(preferred, duration), expected_slots, context)
+            self.assertEqual(service.suggest_next_available(preferred, duration, lookahead),
+                             expected_next, context)
+
+            snapshot = service.day_snapshot(preferred, duration, max_days_ahead=lookahead)
+            self.assertEqual(snapshot['slots'], expected_slots, context)
+            self.assertEqual(snapshot['conflict'], expected_conflict, context)
+            self.assertEqual(snapshot['next_available'], expected_next, context)
+
+
+class TestCheckConflict(unittest.TestCase):
+
+    def test_outside_business_hours_is_a_conflict(self):
+        service = make_service([])
+        self.assertTrue(service.check_conflict(datetime(2030, 1, 15, 8, 30, tzinfo=TIMEZONE)))
+        self.assertFalse(service.check_conflict(datetime(2030, 1, 15, 9, 0, tzinfo=TIMEZONE)))
+
+    def test_overlap_is_a_conflict(self):
+        start = datetime(2030, 1, 15, 10, 0, tzinfo=TIMEZONE)
+        service = make_service([(start, start + timedelta(minutes=30))])
+        self.assertTrue(service.check_conflict(start + timedelta(minutes=15)))
+        self.assertFalse(service.check_conflict(start + timedelta(minutes=30)))
+
+
+if __name__ == '__main__':
+    unittest.main()